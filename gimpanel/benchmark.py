@@ -0,0 +1,287 @@
+'''Headless end-to-end benchmark: start Xvfb and a private dbus-daemon, bring
+up a real GimPanel, send it kimpanel signals like fcitx does and write the
+results as JSON, to compare them between versions
+
+    python -m gimpanel.benchmark [--output FILE] [--rounds N] [--backend BACKEND]
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import optparse
+import tempfile
+import subprocess
+
+from gimpanel import __version__
+
+PROPERTIES = ['/Fcitx/logo:Fcitx:fcitx:Fcitx',
+              '/Fcitx/im:Pinyin:fcitx-pinyin:Pinyin',
+              '/Fcitx/chttrans:Simplified:fcitx-chttrans-inactive:Simplified',
+              '/Fcitx/punc:Full width punct:fcitx-punc-active:Full width punct',
+              '/Fcitx/fullwidth:Half width:fcitx-fullwidth-inactive:Half width',
+              '/Fcitx/remind:Remind:fcitx-remind-active:Remind']
+
+IMS = ['fcitx-keyboard-us:Keyboard:fcitx-kbd:Keyboard',
+       'pinyin:Pinyin:fcitx-pinyin:Pinyin',
+       'wubi:Wubi:fcitx-wubi:Wubi',
+       'shuangpin:Shuangpin:fcitx-shuangpin:Shuangpin']
+
+# "ni" candidates
+CANDIDATES = [u'\u4f60\u597d', u'\u62df\u597d', u'\u5462', u'\u4f60', u'\u5c3c',
+              u'\u6ce5', u'\u9006', u'\u817b', u'\u5b81', u'\u4f31']
+
+
+def _lookup_table(page, size=9):
+    texts = [CANDIDATES[(page + i) % len(CANDIDATES)] for i in range(size)]
+    return ['%d.' % (i + 1) for i in range(size)], texts, [''] * size, page > 0, True
+
+
+def typing_burst(rounds):
+    '''Type "nihao" and commit it, like fcitx does for every keystroke'''
+    events, keystrokes = [], 0
+    for n in range(rounds):
+        word = 'nihao'
+        for i in range(1, len(word) + 1):
+            keystrokes += 1
+            preedit = word[:i]
+            events.extend([
+                (0, 'SetSpotRect', (100 + i * 8, 200, 0, 18)),
+                (0, 'UpdatePreeditText', (preedit, '')),
+                (0, 'UpdateAux', (preedit, '')),
+                (0, 'UpdateLookupTable', _lookup_table(i)),
+                (0, 'ShowPreedit', (True,)),
+                (0, 'ShowAux', (True,)),
+                (0, 'ShowLookupTable', (True,)),
+            ])
+        keystrokes += 1
+        events.extend([
+            (0, 'ShowPreedit', (False,)),
+            (0, 'ShowAux', (False,)),
+            (0, 'ShowLookupTable', (False,)),
+        ])
+
+    return events, keystrokes
+
+
+def page_flips(rounds):
+    '''Flip through the candidate pages and move the highlight'''
+    events = [(0, 'ShowAux', (True,)), (0, 'UpdateAux', ('ni', '')),
+              (0, 'ShowLookupTable', (True,))]
+    for n in range(rounds):
+        events.append((0, 'UpdateLookupTable', _lookup_table(n)))
+        for cursor in range(9):
+            events.append((0, 'UpdateLookupTableCursor', (cursor,)))
+    events.extend([(0, 'ShowAux', (False,)), (0, 'ShowLookupTable', (False,))])
+
+    return events, rounds * 10
+
+
+def im_switches(rounds):
+    '''Switch between the enabled IMs'''
+    events = [(0, 'ExecMenu', (IMS,)), (0, 'RegisterProperties', (PROPERTIES,))]
+    for n in range(rounds):
+        im = IMS[n % len(IMS)].split(':', 1)[1]
+        events.extend([
+            (0, 'UpdateProperty', ('/Fcitx/im:%s' % im,)),
+            (0, 'Enable', (True,)),
+            (0, 'ExecMenu', (IMS,)),
+        ])
+
+    return events, rounds
+
+
+def property_floods(rounds):
+    '''Register the properties again and again, like on focus changes'''
+    events = []
+    for n in range(rounds):
+        properties = list(PROPERTIES)
+        if n % 2:
+            properties[2] = '/Fcitx/chttrans:Traditional:fcitx-chttrans-active:Traditional'
+        events.extend([(0, 'RegisterProperties', (properties,)),
+                       (0, 'Enable', (True,))])
+
+    return events, rounds
+
+
+SCENARIOS = [
+    ('typing_burst', typing_burst),
+    ('page_flips', page_flips),
+    ('im_switches', im_switches),
+    ('property_floods', property_floods),
+]
+
+
+def start_xvfb():
+    '''Start Xvfb on a free display, return (process, display)'''
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(['Xvfb', '-displayfd', str(write_fd),
+                                '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'])
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        process.kill()
+        raise RuntimeError('Failed to start Xvfb')
+
+    return process, ':%s' % display
+
+
+def get_rss():
+    '''The resident set size of this process in KiB'''
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class WindowCounter(object):
+    '''Count the paints, moves and resizes of a window'''
+    def __init__(self, window):
+        self.paints = self.moves = self.resizes = 0
+        self._geometry = None
+        window.get_frame_clock().connect('after-paint', self.on_after_paint)
+        window.connect('configure-event', self.on_configure_event)
+
+    def on_after_paint(self, frame_clock):
+        self.paints += 1
+
+    def on_configure_event(self, window, event):
+        geometry = event.x, event.y, event.width, event.height
+        if self._geometry:
+            if geometry[:2] != self._geometry[:2]:
+                self.moves += 1
+            if geometry[2:] != self._geometry[2:]:
+                self.resizes += 1
+        self._geometry = geometry
+        return False
+
+    def reset(self):
+        self.paints = self.moves = self.resizes = 0
+
+
+def run_scenario(panel, counter, dispatch, events, keystrokes, timeout=30):
+    from gimpanel.replay import run_pending_events, wait_until
+
+    controller = panel._controller
+    n_signals = sum(1 for e in events if e[1] != 'SetSpotRect')
+    received = sum(controller.get_signal_counts().values())
+
+    counter.reset()
+    controller.latency.reset()
+    collapsed = panel.collapsed_updates
+    start = time.time()
+    for timestamp, name, args in events:
+        dispatch(controller, name, args)
+        run_pending_events()
+
+    # Wait until the panel got all the signals and rendered them
+    deadline = start + timeout
+    while sum(controller.get_signal_counts().values()) - received < n_signals and \
+          time.time() < deadline:
+        wait_until(time.time() + 0.001)
+    elapsed = time.time() - start
+    wait_until(time.time() + 0.1)
+
+    render = controller.latency.get('Panel', 'render')
+    return {
+        'signals': n_signals,
+        'keystrokes': keystrokes,
+        'seconds': round(elapsed, 6),
+        'signals_per_second': round(n_signals / elapsed, 1) if elapsed else 0,
+        'render_passes': render.count if render else 0,
+        'render_us': render.total if render else 0,
+        'frames_painted': counter.paints,
+        'collapsed_updates': panel.collapsed_updates - collapsed,
+        'moves_per_keystroke': round(counter.moves / float(keystrokes), 3),
+        'resizes_per_keystroke': round(counter.resizes / float(keystrokes), 3),
+        'rss_kib': get_rss(),
+    }
+
+
+def run(rounds, direct=False, backend='gdbus'):
+    import dbus
+    import dbus.mainloop.glib
+    from gimpanel.replay import start_private_bus, stop_private_bus, connect_bus
+    from gimpanel.replay import run_pending_events, direct_dispatch, BusDispatcher
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus_process, address = start_private_bus()
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = address
+    try:
+        from gimpanel.main import GimPanel
+
+        panel = GimPanel(connect_bus(address, backend))
+        panel.show_all()
+        run_pending_events()
+        if not panel.warmed_up or panel.label_height == 0:
+            raise RuntimeError('The candidate window was not warmed up on startup')
+        counter = WindowCounter(panel)
+
+        dispatch = direct_dispatch if direct else BusDispatcher(address)
+        results = {}
+        for name, scenario in SCENARIOS:
+            events, keystrokes = scenario(rounds)
+            results[name] = run_scenario(panel, counter, dispatch, events, keystrokes)
+
+        return results
+    finally:
+        stop_private_bus(bus_process)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--output', metavar='FILE',
+                      help='Write the JSON results to FILE instead of stdout')
+    parser.add_option('--rounds', type='int', default=50,
+                      help='How many times each scenario is repeated')
+    parser.add_option('--direct', action='store_true', default=False,
+                      help='Call the controller directly instead of going through D-Bus')
+    parser.add_option('--backend', choices=('gdbus', 'dbus-python'), default='gdbus',
+                      help='The D-Bus backend of the panel: gdbus, dbus-python')
+    parser.add_option('--display', metavar='DISPLAY',
+                      help='Use this X display instead of starting Xvfb')
+    options, args = parser.parse_args(argv)
+
+    xvfb_process = None
+    if options.display:
+        os.environ['DISPLAY'] = options.display
+    else:
+        xvfb_process, os.environ['DISPLAY'] = start_xvfb()
+
+    # An empty fcitx config, so the log, the state and the profile of the
+    # user are not touched and the results do not depend on them. Set before
+    # any gimpanel module reads CONFIG_ROOT.
+    config_home = tempfile.mkdtemp(prefix='gimpanel-benchmark-')
+    os.mkdir(os.path.join(config_home, 'fcitx'))
+    os.environ['XDG_CONFIG_HOME'] = config_home
+
+    try:
+        results = {
+            'version': __version__,
+            'rounds': options.rounds,
+            'transport': 'direct' if options.direct else 'dbus',
+            'backend': options.backend,
+            'scenarios': run(options.rounds, options.direct, options.backend),
+        }
+    finally:
+        if xvfb_process:
+            os.kill(xvfb_process.pid, signal.SIGTERM)
+            xvfb_process.wait()
+        # The pending state writes go there, do them before it is removed
+        from gimpanel.statestore import state_store
+        state_store.flush()
+        shutil.rmtree(config_home)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,5 +13,3 @@ def init_locale():
         gettext.install('fcitx-gimpanel', unicode=True)
 
         INIT = True
-
-init_locale()
@@ -1,11 +1,31 @@
 import os
+import ast
 import logging
+import StringIO
 import ConfigParser
 
+from gi.repository import Gio, GObject
+
 from gimpanel.common import CONFIG_ROOT
+from gimpanel.statestore import state_store
 
 log = logging.getLogger('ConfigSetting')
 
+def parse_literal(value):
+    '''Parse a quoted string or a true/false token, without eval'''
+    if value in ('true', 'True'):
+        return True
+    elif value in ('false', 'False'):
+        return False
+
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value[1:-1]
+
+    return value
+
 class ConfigSetting(object):
     '''Just pass the file path'''
     def __init__(self, path, type=type):
@@ -36,15 +56,48 @@ class ConfigSetting(object):
 
         # This is a hard code str type, so return '"xxx"' instead of 'xxx'
         if self._type == str or type(value) == str:
-            if (value.startswith('"') and value.endswith('"')) or \
-               (value.startswith("'") and value.endswith("'")):
-                value = eval(value)
+            value = parse_literal(value)
 
         return value
 
-    def init_configparser(self):
+    def _get_stat(self):
+        try:
+            stat = os.stat(self._path)
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
+
+    def _read(self):
+        try:
+            with open(self._path) as f:
+                return f.read()
+        except IOError:
+            return ''
+
+    def _parse(self, content):
+        self._content = content
         self._configparser = ConfigParser.ConfigParser()
-        self._configparser.read(self._path)
+        self._configparser.readfp(StringIO.StringIO(content), self._path)
+
+    def init_configparser(self):
+        self._stat = self._get_stat()
+        self._parse(self._read())
+
+    def reload(self):
+        '''Re-parse the file only if its mtime or contents changed, return
+        True if it was re-parsed'''
+        stat = self._get_stat()
+        if stat == self._stat:
+            return False
+
+        self._stat = stat
+        content = self._read()
+        if content == self._content:
+            return False
+
+        log.debug("%s changed, re-parse it", self._path)
+        self._parse(content)
+        return True
 
     def sections(self):
         return self._configparser.sections()
@@ -59,10 +112,20 @@ class ConfigSetting(object):
             self._configparser.add_section(section)
 
         self._configparser.set(section, option, value)
-        with open(self._path, 'wb') as configfile:
-            self._configparser.write(configfile)
 
-        self.init_configparser()
+        output = StringIO.StringIO()
+        self._configparser.write(output)
+        self._content = output.getvalue()
+        state_store.write(self._path, self._content, self._on_written)
+
+    def _on_written(self, path):
+        # Called on the writer thread, reload() uses _stat on the main thread
+        GObject.idle_add(self._record_written_stat)
+
+    def _record_written_stat(self):
+        # The parser already has what was written, so do not read it back
+        self._stat = self._get_stat()
+        return False
 
     def get_value(self, section, option):
         if self._type:
@@ -86,22 +149,57 @@ class ConfigSetting(object):
 
 
 class FcitxConfig(object):
+    '''The fcitx profile, the values are parsed once and cached until the
+    file monitor reports a change of the profile'''
     def __init__(self):
-        self._profile = ConfigSetting(os.path.join(CONFIG_ROOT, 'profile'))
-
-    def get_current_im(self):
-        return self._profile.get_value('Profile', 'IMName')
-
-    def get_enabled_ims(self):
-        list_value = self._profile.get_value('Profile', 'EnabledIMList')
+        path = os.path.join(CONFIG_ROOT, 'profile')
+        self._profile = ConfigSetting(path)
+        self._update_cache()
+        self._changed = False
+
+        self._monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.NONE,
+                                                                 None)
+        self._monitor.connect('changed', self.on_profile_changed)
+
+    def on_profile_changed(self, monitor, file, other_file, event_type):
+        self._changed = True
+
+    def _check_changed(self):
+        if self._changed:
+            self._changed = False
+            if self._profile.reload():
+                self._update_cache()
+
+    def _update_cache(self):
+        try:
+            self._current_im = self._profile.get_value('Profile', 'IMName')
+        except ConfigParser.Error:
+            self._current_im = ''
+
+        try:
+            list_value = self._profile.get_value('Profile', 'EnabledIMList')
+        except ConfigParser.Error:
+            list_value = ''
+        self._enabled_ims = self.parse_enabled_ims(list_value)
+
+    @staticmethod
+    def parse_enabled_ims(list_value):
+        '''Parse "name:True,name:False,..." to the enabled names'''
         enabled_ims = []
         for im_pair in list_value.split(','):
-            im_name, enable_status = im_pair.split(':')
-            enable_status = eval(enable_status)
-            if enable_status:
+            im_name, sep, enable_status = im_pair.strip().rpartition(':')
+            if im_name and parse_literal(enable_status) is True:
                 enabled_ims.append(im_name)
 
         return enabled_ims
 
+    def get_current_im(self):
+        self._check_changed()
+        return self._current_im
+
+    def get_enabled_ims(self):
+        self._check_changed()
+        return list(self._enabled_ims)
+
 
 fcitx_config = FcitxConfig()
@@ -2,32 +2,152 @@ import logging
 
 import dbus
 import dbus.service
+from gi.repository import GLib
+
+from gimpanel.stats import LatencyStats
 
 log = logging.getLogger('GimPanelController')
 
-class GimPanelController(dbus.service.Object):
-    def __init__(self, session_bus, panel):
+BUS_NAME = 'org.kde.impanel'
+OBJECT_PATH = '/org/kde/impanel'
+KIMPANEL_INTERFACE = 'org.kde.kimpanel.inputmethod'
+
+# The org.kde.kimpanel.inputmethod signals sent by fcitx, with their arguments
+KIMPANEL_SIGNALS = {
+    'ExecDialog': ('s',),
+    'ExecMenu': ('as',),
+    'RegisterProperties': ('as',),
+    'UpdateProperty': ('s',),
+    'RemoveProperty': ('s',),
+    'ShowAux': ('b',),
+    'ShowPreedit': ('b',),
+    'ShowLookupTable': ('b',),
+    'UpdateLookupTable': ('as', 'as', 'as', 'b', 'b'),
+    'UpdateLookupTableCursor': ('i',),
+    'UpdatePreeditCaret': ('i',),
+    'UpdatePreeditText': ('s', 's'),
+    'UpdateAux': ('s', 's'),
+    'UpdateSpotLocation': ('i', 'i'),
+    'UpdateScreen': ('i',),
+    'Enable': ('b',),
+}
+
+# Only log every Nth occurrence of an unhandled signal
+UNHANDLED_LOG_INTERVAL = 100
+
+class BaseController(object):
+    '''Dispatch the kimpanel signals to the panel and keep the statistics,
+    the subclasses connect it to the bus'''
+    def __init__(self, panel):
         self._panel = panel
+        self._signal_counts = {}
+        self.latency = LatencyStats()
+        self._unpainted = []
+        self._recorder = None
+        self._handlers = self._build_dispatch_table(panel)
 
-        bus_name = dbus.service.BusName('org.kde.impanel', bus=session_bus)
-        dbus.service.Object.__init__(self, bus_name, '/org/kde/impanel')
-        session_bus.add_signal_receiver(self.signal_handler,
-                                        dbus_interface='org.kde.kimpanel.inputmethod',
-                                        member_keyword='member')
+    def _build_dispatch_table(self, panel):
+        handlers = {}
+        for signal_name, signature in KIMPANEL_SIGNALS.iteritems():
+            handler = getattr(panel, signal_name, None)
+            if handler:
+                handlers[signal_name] = (handler, len(signature))
+            else:
+                log.debug("No handler for signal: %s", signal_name)
+            self._signal_counts[signal_name] = 0
+
+        return handlers
+
+    def set_recorder(self, recorder):
+        '''Record the incoming signals with a gimpanel.trace.TraceRecorder'''
+        self._recorder = recorder
+
+    def get_signal_counts(self):
+        '''Return how many times each signal has been received'''
+        return dict(self._signal_counts)
 
     def signal_handler(self, *args, **kwargs):
+        received = GLib.get_monotonic_time()
         signal_name = kwargs['member']
+        if self._recorder:
+            self._recorder.record(signal_name, args)
+
+        count = self._signal_counts.get(signal_name, 0) + 1
+        self._signal_counts[signal_name] = count
+
+        try:
+            handler, n_args = self._handlers[signal_name]
+        except KeyError:
+            self._unhandled_signal(signal_name, count, args)
+            # Like before the dispatch table, every signal ends in a
+            # visibility check
+            self._panel.queue_render()
+            return
+
+        if len(args) != n_args:
+            log.warning("Signal %s expects %d args, got %d",
+                        signal_name, n_args, len(args))
+            self._panel.queue_render()
+            return
+
+        dirty_marks = self._panel.dirty_marks
+        handler(*args)
+        self.latency.record(signal_name, 'handle',
+                            GLib.get_monotonic_time() - received)
+        # Only the signals which changed the panel wait for its paint, the
+        # others (e.g. UpdateProperty) would be sampled at an unrelated paint
+        if self._panel.dirty_marks != dirty_marks:
+            self._unpainted.append((signal_name, received))
+        self._panel.queue_render()
 
-        if hasattr(self._panel, signal_name):
-            getattr(self._panel, signal_name)(*args)
-        else:
-            log.warning("Un-handle signal_name: %s" % signal_name)
-            for i, arg in enumerate(args):
-                log.warning("\targs-%d: %s" % (i + 1, arg))
-            for k, v in enumerate(kwargs):
-                log.warning("\tdict args-%d: %s: %s" % (k, v, kwargs[v]))
+    def record_paint(self):
+        '''Called when the panel is painted, the signals received since the
+        last paint are counted as shown on screen'''
+        if self._unpainted:
+            painted = GLib.get_monotonic_time()
+            for signal_name, received in self._unpainted:
+                self.latency.record(signal_name, 'paint', painted - received)
+            del self._unpainted[:]
 
-        self._panel.do_visible_task()
+    def discard_unpainted(self):
+        '''The signals since the last paint will not lead to a paint'''
+        del self._unpainted[:]
+
+    def _unhandled_signal(self, signal_name, count, args):
+        if count == 1:
+            log.warning("Un-handle signal_name: %s, args: %r", signal_name, args)
+        elif count % UNHANDLED_LOG_INTERVAL == 0:
+            log.warning("Un-handle signal_name: %s received %d times",
+                        signal_name, count)
+
+    def set_spot_rect(self, x, y, w, h):
+        if self._recorder:
+            self._recorder.record('SetSpotRect', (x, y, w, h))
+
+        self._panel.set_spot_rect(x, y, w, h)
+
+    def get_latency_stats(self, reset):
+        '''Return "signal:stage" to (count, p50, p95, p99, max) in microseconds,
+        the stage is "handle" for the handler time and "paint" until painted,
+        "Panel:render" is the time of the panel render passes, "show" and
+        "hide" of GimPanel and LangPanel the time until the window changed'''
+        summary = self.latency.summary()
+        if reset:
+            self.latency.reset()
+
+        return summary
+
+
+class GimPanelController(dbus.service.Object, BaseController):
+    '''The controller on a dbus-python bus connection'''
+    def __init__(self, session_bus, panel):
+        BaseController.__init__(self, panel)
+
+        bus_name = dbus.service.BusName(BUS_NAME, bus=session_bus)
+        dbus.service.Object.__init__(self, bus_name, OBJECT_PATH)
+        session_bus.add_signal_receiver(self.signal_handler,
+                                        dbus_interface=KIMPANEL_INTERFACE,
+                                        member_keyword='member')
 
     @dbus.service.signal('org.kde.impanel')
     def Configure(self):
@@ -56,6 +176,9 @@ class GimPanelController(dbus.service.Object):
     @dbus.service.method('org.kde.impanel2',
                          in_signature='iiii', out_signature='')
     def SetSpotRect(self, x, y, w, h):
-        self._panel._cursor_x = x
-        self._panel._cursor_y = y
-        self._panel._cursor_h = h
+        self.set_spot_rect(x, y, w, h)
+
+    @dbus.service.method('org.kde.impanel2',
+                         in_signature='b', out_signature='a{s(uuuuu)}')
+    def GetLatencyStats(self, reset):
+        return self.get_latency_stats(reset)
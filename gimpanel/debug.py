@@ -1,6 +1,11 @@
 import os
+import Queue
+import atexit
 import logging
+import logging.handlers
+import functools
 import StringIO
+import threading
 import traceback
 
 from gimpanel.common import CONFIG_ROOT
@@ -40,57 +45,156 @@ class ColoredFormatter(logging.Formatter):
         return logging.Formatter.format(self, record)
 
 
+class QueueHandler(logging.Handler):
+    '''Hand the records to a background thread which writes them with the
+    target handlers, so the caller (the GTK main thread) never blocks on I/O.
+    When the queue is full the record is dropped and counted.'''
+    def __init__(self, handlers, maxsize=1000):
+        logging.Handler.__init__(self)
+        self._handlers = handlers
+        self._queue = Queue.Queue(maxsize)
+        self.dropped = 0
+        self._reported_dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name='GimPanelLog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _prepare(self, record):
+        # Merge the args and the traceback into the message now, the objects
+        # they refer to may change before the record is written
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(self._prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _write(self, record):
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+
+            self._write(record)
+
+            if self.dropped != self._reported_dropped and self._queue.empty():
+                self._reported_dropped = self.dropped
+                self._write(logging.LogRecord('GimPanelLogger', logging.WARNING,
+                                              __file__, 0,
+                                              '%d log messages dropped, the log queue was full',
+                                              (self.dropped,), None))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(1)
+        for handler in self._handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+
 class GimPanelLogger(logging.Logger):
     COLOR_FORMAT = "[%(asctime)s]" + "[" + BOLD_SEQ + "%(name)s" + RESET_SEQ + \
                    "][%(levelname)s] %(message)s (" + BOLD_SEQ + \
                    "%(filename)s" + RESET_SEQ + ":%(lineno)d)"
     NO_COLOR_FORMAT = "[%(asctime)s][%(name)s][%(levelname)s] %(message)s " \
                       "(%(filename)s:%(lineno)d)"
-    LOG_FILE_HANDLER = None
+    LOG_MAX_BYTES = 1024 * 1024
+    LOG_BACKUP_COUNT = 2
+    LOG_QUEUE_SIZE = 1000
+    LOG_HANDLER = None
 
     def __init__(self, name):
         logging.Logger.__init__(self, name)
 
-        #Add two handlers, a stderr one, and a file one
+        #Create the single handler shared by all the loggers
+        if GimPanelLogger.LOG_HANDLER == None:
+            GimPanelLogger.LOG_HANDLER = GimPanelLogger._create_handler()
+
+        self.addHandler(GimPanelLogger.LOG_HANDLER)
+
+    @staticmethod
+    def _create_handler():
+        #Add two handlers, a file one and a stderr one, written by a thread
         color_formatter = ColoredFormatter(GimPanelLogger.COLOR_FORMAT)
         no_color_formatter = ColoredFormatter(GimPanelLogger.NO_COLOR_FORMAT,
                                               False)
 
-        #create the single file appending handler
-        if GimPanelLogger.LOG_FILE_HANDLER == None:
-            filename = os.path.join(CONFIG_ROOT, 'fcitx-gimpanel.log')
-            GimPanelLogger.LOG_FILE_HANDLER = logging.FileHandler(filename, 'w')
-            GimPanelLogger.LOG_FILE_HANDLER.setFormatter(no_color_formatter)
+        filename = os.path.join(CONFIG_ROOT, 'fcitx-gimpanel.log')
+        file_handler = logging.handlers.RotatingFileHandler(filename,
+                                                            maxBytes=GimPanelLogger.LOG_MAX_BYTES,
+                                                            backupCount=GimPanelLogger.LOG_BACKUP_COUNT)
+        #Keep the log of the previous session as fcitx-gimpanel.log.1
+        if os.path.exists(filename) and os.path.getsize(filename):
+            file_handler.doRollover()
+        file_handler.setFormatter(no_color_formatter)
 
         console = logging.StreamHandler()
         console.setFormatter(color_formatter)
 
-        self.addHandler(GimPanelLogger.LOG_FILE_HANDLER)
-        self.addHandler(console)
-        return
+        handler = QueueHandler([file_handler, console],
+                               GimPanelLogger.LOG_QUEUE_SIZE)
+        atexit.register(handler.close)
+
+        return handler
+
+
+# Checked by log_func on every call, so keep it a plain module global instead
+# of asking the logging hierarchy for the effective level each time
+DEBUG_ENABLED = False
+
+# The environment variable to turn on the debug tracing
+DEBUG_ENV = 'GIMPANEL_DEBUG'
+
+def _set_level(level):
+    global DEBUG_ENABLED
+    logging.getLogger().setLevel(level)
+    DEBUG_ENABLED = level <= logging.DEBUG
 
 
 def enable_debugging():
-    logging.getLogger().setLevel(logging.DEBUG)
+    _set_level(logging.DEBUG)
 
 
 def disable_debugging():
-    logging.getLogger().setLevel(logging.INFO)
+    _set_level(logging.INFO)
 
 
 def disable_logging():
-    logging.getLogger().setLevel(logging.CRITICAL + 1)
+    _set_level(logging.CRITICAL + 1)
+
+
+def is_debugging_requested(option=False):
+    '''Debug tracing is off unless --debug is passed or GIMPANEL_DEBUG is set'''
+    return option or os.environ.get(DEBUG_ENV, '') not in ('', '0')
 
 logging.setLoggerClass(GimPanelLogger)
 
 def log_func(log):
     def wrap(func):
+        @functools.wraps(func)
         def func_wrapper(*args, **kwargs):
-            log.debug("%s:" % func)
-            for i, arg in enumerate(args):
-                log.debug("\targs-%d: %s" % (i + 1, arg))
-            for k, v in enumerate(kwargs):
-                log.debug("\tdict args-%d: %s: %s" % (k, v, kwargs[v]))
+            if DEBUG_ENABLED:
+                log.debug("%s:", func)
+                for i, arg in enumerate(args):
+                    log.debug("\targs-%d: %s", i + 1, arg)
+                for k, v in enumerate(kwargs):
+                    log.debug("\tdict args-%d: %s: %s", k, v, kwargs[v])
             return func(*args, **kwargs)
         return func_wrapper
     return wrap
@@ -0,0 +1,45 @@
+class FcitxProperty(object):
+    '''A property sent by fcitx as "key:label:icon:tooltip"'''
+    __slots__ = ('key', 'label', 'icon', 'tooltip')
+
+    def __init__(self, key, label='', icon='', tooltip=''):
+        self.key = key
+        self.label = label
+        self.icon = icon
+        self.tooltip = tooltip
+
+    def __eq__(self, other):
+        return isinstance(other, FcitxProperty) and \
+               (self.key, self.label, self.icon, self.tooltip) == \
+               (other.key, other.label, other.icon, other.tooltip)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'FcitxProperty(%r, %r, %r, %r)' % (self.key, self.label,
+                                                 self.icon, self.tooltip)
+
+# The properties seen so far, fcitx sends the same few strings over and over
+_property_cache = {}
+PROPERTY_CACHE_SIZE = 256
+
+def parse_property(raw):
+    '''Return the FcitxProperty of the raw string, None for an empty one'''
+    try:
+        return _property_cache[raw]
+    except KeyError:
+        pass
+
+    if not raw:
+        return None
+
+    fields = raw.split(':', 3)
+    fields.extend([''] * (4 - len(fields)))
+    prop = FcitxProperty(*fields)
+
+    if len(_property_cache) >= PROPERTY_CACHE_SIZE:
+        _property_cache.clear()
+    _property_cache[raw] = prop
+
+    return prop
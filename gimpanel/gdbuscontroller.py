@@ -0,0 +1,123 @@
+import logging
+
+from gi.repository import Gio, GLib
+
+from gimpanel.controller import BaseController
+from gimpanel.controller import BUS_NAME, OBJECT_PATH, KIMPANEL_INTERFACE
+
+log = logging.getLogger('GDBusController')
+
+# The same interfaces as the dbus-python GimPanelController exports
+INTROSPECTION_XML = '''
+<node>
+  <interface name="org.kde.impanel">
+    <signal name="Configure"/>
+    <signal name="PanelCreated"/>
+    <signal name="LookupTablePageUp"/>
+    <signal name="LookupTablePageDown"/>
+    <signal name="TriggerProperty">
+      <arg type="s" name="key"/>
+    </signal>
+  </interface>
+  <interface name="org.kde.impanel2">
+    <signal name="PanelCreated2"/>
+    <method name="SetSpotRect">
+      <arg type="i" name="x" direction="in"/>
+      <arg type="i" name="y" direction="in"/>
+      <arg type="i" name="w" direction="in"/>
+      <arg type="i" name="h" direction="in"/>
+    </method>
+    <method name="GetLatencyStats">
+      <arg type="b" name="reset" direction="in"/>
+      <arg type="a{s(uuuuu)}" name="stats" direction="out"/>
+    </method>
+  </interface>
+</node>
+'''
+
+# The reply of org.freedesktop.DBus.RequestName when the name is ours
+REQUEST_NAME_REPLY_PRIMARY_OWNER = 1
+
+def to_unicode(value):
+    '''GVariant strings unpack to utf-8 str, the handlers work on unicode as
+    they got from dbus-python'''
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    elif isinstance(value, list):
+        return [to_unicode(item) for item in value]
+    return value
+
+
+class GDBusController(BaseController):
+    '''The controller on a Gio.DBusConnection, the signals are matched by
+    GDBus and their arguments come as unpacked GVariants'''
+    def __init__(self, connection, panel):
+        BaseController.__init__(self, panel)
+        self._connection = connection
+
+        self._request_name(BUS_NAME)
+        node_info = Gio.DBusNodeInfo.new_for_xml(INTROSPECTION_XML)
+        self._registration_ids = [connection.register_object(OBJECT_PATH,
+                                                             interface_info,
+                                                             self.on_method_call,
+                                                             None, None)
+                                  for interface_info in node_info.interfaces]
+        self._subscription_id = connection.signal_subscribe(None,
+                                                            KIMPANEL_INTERFACE,
+                                                            None, None, None,
+                                                            Gio.DBusSignalFlags.NONE,
+                                                            self.on_signal)
+
+    def _request_name(self, name):
+        '''Own the name before returning like dbus.service.BusName, so fcitx
+        can call the panel as soon as PanelCreated is emitted'''
+        reply = self._connection.call_sync('org.freedesktop.DBus',
+                                           '/org/freedesktop/DBus',
+                                           'org.freedesktop.DBus',
+                                           'RequestName',
+                                           GLib.Variant('(su)', (name, 0)),
+                                           GLib.VariantType.new('(u)'),
+                                           Gio.DBusCallFlags.NONE,
+                                           -1, None)
+        if reply.unpack()[0] != REQUEST_NAME_REPLY_PRIMARY_OWNER:
+            log.warning("%s is owned by another panel, queued", name)
+
+    def on_signal(self, connection, sender, object_path, interface_name,
+                  signal_name, parameters):
+        args = [to_unicode(arg) for arg in parameters.unpack()]
+        self.signal_handler(*args, member=signal_name)
+
+    def on_method_call(self, connection, sender, object_path, interface_name,
+                       method_name, parameters, invocation):
+        args = parameters.unpack()
+        if method_name == 'SetSpotRect':
+            self.set_spot_rect(*args)
+            invocation.return_value(None)
+        elif method_name == 'GetLatencyStats':
+            invocation.return_value(GLib.Variant('(a{s(uuuuu)})',
+                                                 (self.get_latency_stats(*args),)))
+        else:
+            invocation.return_dbus_error('org.freedesktop.DBus.Error.UnknownMethod',
+                                         'No such method: %s' % method_name)
+
+    def _emit(self, interface_name, signal_name, parameters=None):
+        self._connection.emit_signal(None, OBJECT_PATH, interface_name,
+                                     signal_name, parameters)
+
+    def Configure(self):
+        self._emit('org.kde.impanel', 'Configure')
+
+    def PanelCreated(self):
+        self._emit('org.kde.impanel', 'PanelCreated')
+
+    def PanelCreated2(self):
+        self._emit('org.kde.impanel2', 'PanelCreated2')
+
+    def LookupTablePageUp(self):
+        self._emit('org.kde.impanel', 'LookupTablePageUp')
+
+    def LookupTablePageDown(self):
+        self._emit('org.kde.impanel', 'LookupTablePageDown')
+
+    def TriggerProperty(self, key):
+        self._emit('org.kde.impanel', 'TriggerProperty', GLib.Variant('(s)', (key,)))
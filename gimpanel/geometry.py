@@ -0,0 +1,99 @@
+import logging
+
+from gi.repository import Gdk
+
+log = logging.getLogger('Geometry')
+
+def place_at_cursor(cursor_x, cursor_y, cursor_h, width, height, workarea):
+    '''Return the position of a window of the size shown under the cursor,
+    or above it if there is no room below, kept inside the work area'''
+    area_x, area_y, area_width, area_height = workarea
+
+    if cursor_x + width > area_x + area_width:
+        x = area_x + area_width - width
+    else:
+        x = cursor_x
+    x = max(x, area_x)
+
+    if cursor_y + cursor_h + height > area_y + area_height:
+        y = cursor_y - height
+    else:
+        y = cursor_y + cursor_h
+
+    return x, y
+
+
+def clamp_to_workarea(x, y, width, height, workarea):
+    '''Return the position moved so the window stays inside the work area'''
+    area_x, area_y, area_width, area_height = workarea
+
+    x = max(min(x, area_x + area_width - width), area_x)
+    y = max(min(y, area_y + area_height - height), area_y)
+
+    return x, y
+
+
+class MonitorGeometry(object):
+    '''The work areas of the monitors, cached and only refreshed when the
+    screen reports a monitor or size change'''
+    def __init__(self, screen=None):
+        self._screen = screen or Gdk.Screen.get_default()
+        self._workareas = []
+        self._last = 0
+
+        self._screen.connect('monitors-changed', self.on_screen_changed)
+        self._screen.connect('size-changed', self.on_screen_changed)
+        self._update()
+
+    def _update(self):
+        self._workareas = []
+        for i in range(self._screen.get_n_monitors()):
+            rect = self._screen.get_monitor_workarea(i)
+            self._workareas.append((rect.x, rect.y, rect.width, rect.height))
+        self._last = 0
+
+        log.debug("Monitor work areas: %s", self._workareas)
+
+    def on_screen_changed(self, screen):
+        self._update()
+
+    @staticmethod
+    def _contains(workarea, x, y):
+        area_x, area_y, area_width, area_height = workarea
+        return area_x <= x < area_x + area_width and \
+               area_y <= y < area_y + area_height
+
+    @staticmethod
+    def _distance(workarea, x, y):
+        area_x, area_y, area_width, area_height = workarea
+        dx = max(area_x - x, 0, x - (area_x + area_width - 1))
+        dy = max(area_y - y, 0, y - (area_y + area_height - 1))
+        return dx * dx + dy * dy
+
+    def get_workarea_at(self, x, y):
+        '''Return the (x, y, width, height) work area of the monitor holding
+        the point, or the nearest one. The monitor found last time is checked
+        first, the cursor hardly ever changes the monitor.'''
+        workareas = self._workareas
+        if self._contains(workareas[self._last], x, y):
+            return workareas[self._last]
+
+        for i, workarea in enumerate(workareas):
+            if self._contains(workarea, x, y):
+                self._last = i
+                return workarea
+
+        self._last = min(range(len(workareas)),
+                         key=lambda i: self._distance(workareas[i], x, y))
+        return workareas[self._last]
+
+
+_monitor_geometry = None
+
+def get_monitor_geometry():
+    '''The MonitorGeometry of the default screen, shared by the windows'''
+    global _monitor_geometry
+    if _monitor_geometry is None:
+        _monitor_geometry = MonitorGeometry()
+
+    return _monitor_geometry
@@ -0,0 +1,98 @@
+import logging
+
+from gi.repository import Gtk, GLib, GObject
+
+log = logging.getLogger('IconCache')
+
+# The icons fcitx sends for the /Fcitx/* properties
+PROPERTY_ICONS = ('fcitx', 'fcitx-kbd',
+                  'fcitx-chttrans-active', 'fcitx-chttrans-inactive',
+                  'fcitx-punc-active', 'fcitx-punc-inactive',
+                  'fcitx-fullwidth-active', 'fcitx-fullwidth-inactive',
+                  'fcitx-remind-active', 'fcitx-remind-inactive',
+                  'fcitx-vk-active', 'fcitx-vk-inactive')
+
+def get_im_icon_names(ims):
+    '''The icon names of the IM property for the IM names, the keyboard
+    layouts all share fcitx-kbd'''
+    names = []
+    for im in ims:
+        name = 'fcitx-kbd' if im.startswith('fcitx-keyboard') else 'fcitx-%s' % im
+        if name not in names:
+            names.append(name)
+
+    return names
+
+
+class IconCache(GObject.GObject):
+    '''Resolved and rasterized icons by name, dropped when the icon theme
+    changes. "changed" is emitted after that so the users set them again.'''
+    __gsignals__ = {
+        "changed": (GObject.SignalFlags.RUN_LAST, None, ()),
+    }
+
+    def __init__(self, icon_size=Gtk.IconSize.SMALL_TOOLBAR):
+        super(IconCache, self).__init__()
+
+        self._icon_size = icon_size
+        self._theme = None
+        self._pixbufs = {}
+        self._preload_names = []
+        self._preload_queue = []
+        self._preload_id = 0
+
+    def _get_theme(self):
+        if self._theme is None:
+            self._theme = Gtk.IconTheme.get_default()
+            self._theme.connect('changed', self.on_theme_changed)
+        return self._theme
+
+    def _load(self, name):
+        size = Gtk.icon_size_lookup(self._icon_size)[1]
+        try:
+            return self._get_theme().load_icon(name, size,
+                                               Gtk.IconLookupFlags.FORCE_SIZE)
+        except GLib.GError, e:
+            log.warning("Failed to load icon %s: %s", name, e)
+            return None
+
+    def lookup(self, name):
+        '''Return the pixbuf of the icon, None if the theme has no such icon'''
+        if name not in self._pixbufs:
+            self._pixbufs[name] = self._load(name)
+        return self._pixbufs[name]
+
+    def preload(self, names):
+        '''Load the icons on idle, one per iteration'''
+        for name in names:
+            if name not in self._preload_names:
+                self._preload_names.append(name)
+        self._queue_preload(names)
+
+    def _queue_preload(self, names):
+        self._preload_queue.extend(name for name in names
+                                   if name not in self._pixbufs)
+        if self._preload_queue and not self._preload_id:
+            self._preload_id = GObject.idle_add(self._on_preload,
+                                                priority=GObject.PRIORITY_LOW)
+
+    def _on_preload(self):
+        while self._preload_queue:
+            name = self._preload_queue.pop(0)
+            if name not in self._pixbufs:
+                self.lookup(name)
+                return True
+
+        log.debug("Preloaded %d icons", len(self._pixbufs))
+        self._preload_id = 0
+        return False
+
+    def on_theme_changed(self, theme):
+        log.debug("Icon theme changed, drop %d icons", len(self._pixbufs))
+        self._pixbufs.clear()
+        self._preload_queue = []
+        self._queue_preload(self._preload_names)
+        self.emit('changed')
+
+
+icon_cache = IconCache()
@@ -4,24 +4,29 @@ import logging
 from gi.repository import Gtk, Gdk, GObject
 from gimpanel.ui import Handle
 from gimpanel.debug import log_traceback, log_func
-from gimpanel.common import CONFIG_ROOT
+from gimpanel.common import CONFIG_ROOT, init_locale
+from gimpanel.statestore import state_store
+from gimpanel.visibility import VisibilityController
+from gimpanel.iconcache import icon_cache
+from gimpanel.geometry import get_monitor_geometry, clamp_to_workarea
 from gimpanel import __version__
 
 log = logging.getLogger('LangPanel')
 
+HIDE_DELAY = 100
+
 class LangPanel(Gtk.Window):
     panel_x = GObject.Property(type=int, default=0)
     panel_y = GObject.Property(type=int, default=0)
 
-    logo = GObject.Property(type=str, default='')
-    im = GObject.Property(type=str, default='')
-    vk = GObject.Property(type=str, default='')
-    chttrans = GObject.Property(type=str, default='')
-    punc = GObject.Property(type=str, default='')
-    fullwidth = GObject.Property(type=str, default='')
-    remind = GObject.Property(type=str, default='')
+    logo = GObject.Property(type=object)
+    im = GObject.Property(type=object)
+    vk = GObject.Property(type=object)
+    chttrans = GObject.Property(type=object)
+    punc = GObject.Property(type=object)
+    fullwidth = GObject.Property(type=object)
+    remind = GObject.Property(type=object)
     visible = GObject.Property(type=bool, default=False)
-    visible_task_id = GObject.Property(type=int, default=0)
 
     fcitx_prop_dict = {
         '/Fcitx/logo': 'logo',
@@ -42,6 +47,24 @@ class LangPanel(Gtk.Window):
         self.set_resizable(False)
 
         self._controller = controller
+        # The toolbar is built on idle or when first needed by ensure_toolbar
+        self._toolbar = None
+
+        # Enable flips while switching the focus, do not hide at once
+        self._visibility = VisibilityController(self, 'LangPanel',
+                                                hide_delay=HIDE_DELAY,
+                                                stats=controller and controller.latency)
+
+        self._init_languagebar_position()
+
+        self.connect('destroy', self.on_languagebar_destroy)
+        self.connect('size-allocate', self.on_languagebar_position)
+        for signal_name in self.fcitx_prop_dict.values():
+            self.connect('notify::%s' % signal_name, self.on_property_notify, '_%s_button' % signal_name)
+
+    def ensure_toolbar(self):
+        if self._toolbar is not None:
+            return
 
         self._toolbar = Gtk.Toolbar()
         self._toolbar.set_style(Gtk.ToolbarStyle.BOTH_HORIZ)
@@ -80,31 +103,40 @@ class LangPanel(Gtk.Window):
         self._about_button.connect('clicked', self.on_about_clicked)
         self._toolbar.insert(self._about_button, -1)
 
+        for button in self._toolbar.get_children()[1:-1]:
+            button.connect('clicked', self.on_button_clicked)
+            # The icons come from icon_cache instead of an icon name lookup,
+            # the image is not shown by show_all() as the button is no_show_all
+            image = Gtk.Image()
+            image.show()
+            button.set_icon_widget(image)
+            # Only shown by on_property_notify once fcitx registers the property
+            button.set_no_show_all(True)
+
         self.add(self._toolbar)
+        self._toolbar.show_all()
 
-        self._init_languagebar_position()
+        # Apply the properties registered before the toolbar was built
+        self._update_buttons()
+        icon_cache.connect('changed', self.on_icon_cache_changed)
 
-        self.connect('destroy', self.on_languagebar_destroy)
-        self.connect('size-allocate', self.on_languagebar_position)
-        for signal_name in self.fcitx_prop_dict.values():
-            self.connect('notify::%s' % signal_name, self.on_property_notify, '_%s_button' % signal_name)
+    def _update_buttons(self):
+        for name in self.fcitx_prop_dict.itervalues():
+            self._update_button(name, '_%s_button' % name)
 
-        for button in self._toolbar.get_children()[1:-1]:
-            button.connect('clicked', self.on_button_clicked)
+    def on_icon_cache_changed(self, icon_cache):
+        self._update_buttons()
 
     def do_visible_task(self):
-        if self.visible_task_id == 0:
-            self.visible_task_id = GObject.timeout_add(100, self._do_real_visible_task)
-
-    def _do_real_visible_task(self):
-        if self.visible != self.get_visible():
-            self.set_visible(self.visible)
-        self.visible_task_id = 0
+        if self.visible:
+            self.ensure_toolbar()
+        self._visibility.set_visible(self.visible)
 
     def on_im_button_clicked(self, widget):
         self.emit('popup_menu')
 
     def on_about_clicked(self, widget=None):
+        init_locale()
         dialog = Gtk.AboutDialog()
         dialog.set_property("program-name", 'Gimpanel')
         dialog.set_property("comments", _('A GTK+ frontend for Fcitx'))
@@ -124,55 +156,76 @@ class LangPanel(Gtk.Window):
         else:
             log.error('Do Not TriggerProperty for /Fcitx/im')
 
-    def reset_toolbar_items(self):
-        for key in self.fcitx_prop_dict.values():
-            setattr(self, key, '')
+    def set_toolbar_item(self, name, fcitx_property):
+        '''Set the FcitxProperty of a toolbar item, only notify if it changed'''
+        if self.get_property(name) == fcitx_property:
+            return False
+
+        self.set_property(name, fcitx_property)
+        return True
+
+    def set_toolbar_items(self, fcitx_properties):
+        '''Set all the toolbar items from a dict of name to FcitxProperty, the
+        items not in it are removed. Return the names of the changed items'''
+        changed = []
+
+        self.freeze_notify()
+        try:
+            for name in self.fcitx_prop_dict.itervalues():
+                if self.set_toolbar_item(name, fcitx_properties.get(name)):
+                    changed.append(name)
+        finally:
+            self.thaw_notify()
+
+        return changed
 
     def is_default_im(self):
         #TODO do not hard code
-        try:
-            value = self.get_property('im').split(':')[2]
-            log.debug("Current IM: %s" % value)
-            return value == 'fcitx-kbd'
-        except Exception, e:
-            log_traceback(log)
+        if self.im is None:
             return True
 
+        log.debug("Current IM: %s", self.im.icon)
+        return self.im.icon == 'fcitx-kbd'
+
     def get_current_im(self):
-        try:
-            return self.get_property('im').split(':')[1]
-        except Exception, e:
-            log_traceback(log)
-            return ''
+        return self.im.label if self.im else ''
 
     def get_current_im_icon_name(self):
-        try:
-            return self.get_property('im').split(':')[2]
-        except Exception, e:
-            log_traceback(log)
-            return ''
+        return self.im.icon if self.im else ''
 
     def on_property_notify(self, widget, prop, widget_name):
-        if self.get_property(prop.name):
-            label, icon_name, tooltip = self.get_property(prop.name).split(':')[1:]
-
-            getattr(self, widget_name).fcitx_prop = self.prop_fcitx_dict[prop.name]
-            getattr(self, widget_name).set_visible(True)
-            getattr(self, widget_name).set_label(label)
-            getattr(self, widget_name).set_icon_name(icon_name)
-            getattr(self, widget_name).set_tooltip_text(tooltip)
+        if self._toolbar is not None:
+            self._update_button(prop.name, widget_name)
+
+    def _update_button(self, name, widget_name):
+        fcitx_property = self.get_property(name)
+        button = getattr(self, widget_name)
+
+        if fcitx_property:
+            button.fcitx_prop = self.prop_fcitx_dict[name]
+            button.set_visible(True)
+            button.set_label(fcitx_property.label)
+            pixbuf = icon_cache.lookup(fcitx_property.icon)
+            if pixbuf:
+                button.get_icon_widget().set_from_pixbuf(pixbuf)
+            else:
+                button.get_icon_widget().set_from_icon_name(fcitx_property.icon,
+                                                            self._toolbar.get_icon_size())
+            button.set_tooltip_text(fcitx_property.tooltip)
         else:
-            getattr(self, widget_name).set_visible(False)
+            button.set_visible(False)
 
-    def on_handle_move_end(self, widget):
-        self.panel_x, self.panel_y = self.get_position()
+    def on_handle_move_end(self, widget, x, y):
+        self.panel_x, self.panel_y = x, y
+        self._save_languagebar_position()
+
+    def _save_languagebar_position(self):
+        state_store.write(os.path.join(CONFIG_ROOT, 'gimpanel-state'),
+                          "%d %d" % (self.panel_x, self.panel_y))
 
     def on_languagebar_destroy(self, widget):
-        try:
-            with open(os.path.join(CONFIG_ROOT, 'gimpanel-state'), 'w') as f:
-                f.write("%d %d" % (self.panel_x, self.panel_y))
-        except Exception, e:
-            log_traceback(log)
+        self._save_languagebar_position()
+        state_store.flush()
 
     def _init_languagebar_position(self):
         try:
@@ -186,17 +239,12 @@ class LangPanel(Gtk.Window):
             log_traceback(log)
 
     def on_languagebar_position(self, widget, *args):
-        window_right = self.panel_x + widget.get_allocation().width
-        window_bottom = self.panel_y + widget.get_allocation().height
-
-
-        root_window = Gdk.get_default_root_window()
-        screen_width, screen_height = root_window.get_width(), root_window.get_height()
-        if window_right > screen_width:
-            self.panel_x = screen_width - widget.get_allocation().width
-
-        if window_bottom > screen_height:
-            self.panel_y = screen_height - widget.get_allocation().height
+        allocation = widget.get_allocation()
+        workarea = get_monitor_geometry().get_workarea_at(self.panel_x, self.panel_y)
+        self.panel_x, self.panel_y = clamp_to_workarea(self.panel_x, self.panel_y,
+                                                       allocation.width,
+                                                       allocation.height,
+                                                       workarea)
 
         self.move(self.panel_x, self.panel_y)
 
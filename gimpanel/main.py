@@ -1,27 +1,66 @@
 #!/usr/bin/python
 
 import os
+import math
 import logging
 
-from gi.repository import Gtk, Gdk, Gio, GObject
+from gi.repository import Gtk, Gdk, Gio, GLib, GObject
 from gi.repository import AppIndicator3 as AppIndicator
 
 from gimpanel.debug import log_traceback, log_func
-from gimpanel.ui import Handle
-from gimpanel.common import CONFIG_ROOT
+from gimpanel.ui import Handle, CandidateView
+from gimpanel.common import CONFIG_ROOT, init_locale
+from gimpanel.textattr import build_attr_list, set_label_text
 from gimpanel.controller import GimPanelController
+from gimpanel.gdbuscontroller import GDBusController
+from gimpanel.fcitxproperty import parse_property
+from gimpanel.geometry import get_monitor_geometry, place_at_cursor
 from gimpanel.langpanel import LangPanel
+from gimpanel.startup import startup_profile
+from gimpanel.visibility import VisibilityController
+from gimpanel.iconcache import icon_cache, get_im_icon_names, PROPERTY_ICONS
+from gimpanel.config import fcitx_config
 
 log = logging.getLogger('GimPanel')
 
+PREEDIT_COLOR = '#c131b5'
+AUX_COLOR = 'blue'
+
+# The candidate window width grows in steps, and only shrinks after a delay
+MIN_WIDTH = 100
+WIDTH_STEP = 40
+SHRINK_DELAY = 1000
+
+# The debounce of hiding the candidate window, in ms
+HIDE_DELAY = 0
+
+# Laid out once on startup to load the fonts: "ni hao" and some candidates
+WARM_UP_PREEDIT = u'ni hao'
+WARM_UP_CANDIDATES = [u'\u4f60\u597d', u'\u62df\u597d', u'\u5462', u'\u4f60',
+                      u'\u5c3c', u'\u6ce5', u'\u9006', u'\u817b', u'\u5b81']
+
 class GimPanel(Gtk.Window):
     label_height = GObject.Property(type=int, default=0)
 
     def __init__(self, session_bus):
         Gtk.Window.__init__(self, type=Gtk.WindowType.POPUP)
+
+        # Claim the bus name and tell fcitx first, the signals are only
+        # dispatched once the main loop runs, when the widgets are ready
+        if isinstance(session_bus, Gio.DBusConnection):
+            self._controller = GDBusController(session_bus, self)
+        else:
+            self._controller = GimPanelController(session_bus, self)
+        self._controller.PanelCreated()
+        self._controller.PanelCreated2()
+        startup_profile.mark('bus connect')
+
         self.set_resizable(False)
         self.set_border_width(2)
-        self.set_size_request(100, -1)
+        self._width = MIN_WIDTH
+        self._shrink_id = 0
+        self._shrink_due = False
+        self.set_size_request(self._width, -1)
 
         hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
         self.add(hbox)
@@ -33,8 +72,8 @@ class GimPanel(Gtk.Window):
                        spacing=3)
         hbox.pack_start(vbox, True, True, 6)
 
-        preedit_hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL,
-                               spacing=6)
+        preedit_hbox = self._preedit_hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL,
+                                                    spacing=6)
         preedit_hbox.connect('size-allocate', self.on_preedit_hbox_allocate)
         vbox.pack_start(preedit_hbox, True, True, 0)
 
@@ -60,21 +99,44 @@ class GimPanel(Gtk.Window):
         self._aux_label.set_alignment(0, 0.5)
         vbox.pack_start(self._aux_label, True, True, 0)
 
-        self._lookup_label = Gtk.Label()
-        self._lookup_label.set_alignment(0, 0.5)
-        vbox.pack_start(self._lookup_label, True, True, 0)
+        self._candidate_view = CandidateView()
+        vbox.pack_start(self._candidate_view, True, True, 0)
 
         self._show_preedit = False
         self._show_lookup = False
         self._show_aux = False
 
+        # Pending state, updated by the kimpanel signals and applied to the
+        # widgets once per main loop iteration by _render_pending()
+        self._preedit_text = ''
+        self._preedit_attr = ''
+        self._rendered_preedit = None
+        self._aux_text = ''
+        self._aux_attr = ''
+        self._lookup_table = None
+        self._lookup_cursor = 0
+        self._dirty = set()
+        # Counts the _mark_dirty calls, the controller tells by it whether a
+        # signal changed the window and so waits for a paint
+        self.dirty_marks = 0
+        self._render_id = 0
+        self._frame_requested = False
+        # How many times a render was queued, and how many of them were
+        # collapsed into an already pending render pass
+        self.queued_updates = 0
+        self.collapsed_updates = 0
+        self.warmed_up = False
+
         self._cursor_x = 0
         self._cursor_y = 0
         self._cursor_h = 0
+        self._last_position = None
         self._showing_popup = False
         self.non_im_items_index = 0
-
-        self._controller = GimPanelController(session_bus, self)
+        self._im_items = {}
+        self._menu_im = None
+        self._menu_dirty = True
+        self._pending_trigger = None
 
         self.setup_indicator()
 
@@ -84,24 +146,30 @@ class GimPanel(Gtk.Window):
         self.langpanel.connect('popup_menu', self.show_popup_menu)
 
         self.connect('destroy', self.on_gimpanel_exit)
-        self.connect("size-allocate", lambda w, a: self._move_position())
+        self.connect("size-allocate", self.on_size_allocate)
         self.connect('realize', self.on_realize)
 
+        self._visibility = VisibilityController(self, 'GimPanel',
+                                                hide_delay=HIDE_DELAY,
+                                                stats=self._controller.latency)
+
+        startup_profile.mark('widget build')
+
     def on_lookup_back(self, widget):
-        self.set_resizable(True)
         self._controller.LookupTablePageUp()
 
     def on_preedit_hbox_allocate(self, widget, allocation):
         if self.label_height == 0:
-            max_height = max(self._preedit_label.get_allocation().height,
-                             self._lookup_label.get_allocation().height,
-                             allocation.height)
-            self.label_height = max_height
-            self._preedit_label.set_size_request(-1, max_height)
-            self._lookup_label.set_size_request(-1, max_height)
+            self._set_label_height(max(self._preedit_label.get_allocation().height,
+                                       self._candidate_view.get_allocation().height,
+                                       allocation.height))
+
+    def _set_label_height(self, max_height):
+        self.label_height = max_height
+        self._preedit_label.set_size_request(-1, max_height)
+        self._candidate_view.set_size_request(-1, max_height)
 
     def on_lookup_forward(self, widget):
-        self.set_resizable(True)
         self._controller.LookupTablePageDown()
 
     def _create_arrow_button(self, stock_id):
@@ -114,11 +182,71 @@ class GimPanel(Gtk.Window):
         return button
 
     def on_realize(self, widget):
-        self._controller.PanelCreated()
-        self._controller.PanelCreated2()
+        frame_clock = self.get_frame_clock()
+        frame_clock.connect('update', self.on_frame_clock_update)
+        frame_clock.connect('after-paint',
+                            lambda *a: self._controller.record_paint())
         self._controller.TriggerProperty('/Fcitx/im')
         self.do_visible_task()
 
+        startup_profile.mark('first realize')
+        GObject.idle_add(self._finish_startup)
+
+    def _finish_startup(self):
+        '''Build what is not needed to show the first candidates'''
+        self._ensure_indicator_menu()
+        icon_cache.preload(PROPERTY_ICONS +
+                           tuple(get_im_icon_names(fcitx_config.get_enabled_ims())))
+        self.langpanel.ensure_toolbar()
+        # Make sure the empty window is hidden, the warm-up needs it so
+        self.do_visible_task()
+        self._warm_up()
+
+        startup_profile.mark('deferred build')
+        startup_profile.report()
+        return False
+
+    def _warm_up(self):
+        '''Lay out and measure representative content while the window is
+        hidden, so the fonts, the glyph metrics and label_height are ready
+        before the first real candidates come'''
+        if self.get_visible():
+            return
+
+        state = (self._show_preedit, self._preedit_text, self._preedit_attr,
+                 self._show_aux, self._aux_text, self._aux_attr,
+                 self._show_lookup, self._lookup_table, self._lookup_cursor)
+
+        try:
+            self._show_preedit, self._preedit_text, self._preedit_attr = True, WARM_UP_PREEDIT, ''
+            self._show_aux, self._aux_text, self._aux_attr = True, WARM_UP_PREEDIT, ''
+            self._show_lookup = True
+            self._lookup_table = (['%d.' % (i + 1) for i in range(len(WARM_UP_CANDIDATES))],
+                                  WARM_UP_CANDIDATES, [], False, False)
+            self._lookup_cursor = 0
+            self._render_preedit()
+            self._render_aux()
+            self._render_lookup_table()
+
+            if self.label_height == 0:
+                self._set_label_height(max(self._preedit_label.get_preferred_height()[1],
+                                           self._candidate_view.get_preferred_height()[1],
+                                           self._preedit_hbox.get_preferred_height()[1]))
+            self.get_preferred_size()
+
+            for label in [self._preedit_label, self._aux_label] + \
+                         self._candidate_view.get_children():
+                label.get_layout().get_pixel_extents()
+        finally:
+            # Put back what fcitx sent meanwhile, the cells stay for reuse
+            (self._show_preedit, self._preedit_text, self._preedit_attr,
+             self._show_aux, self._aux_text, self._aux_attr,
+             self._show_lookup, self._lookup_table, self._lookup_cursor) = state
+            self._mark_dirty('preedit', 'aux', 'lookup')
+            self.queue_render()
+
+        self.warmed_up = True
+
     @log_func(log)
     def on_gimpanel_exit(self, widget):
         self.langpanel.destroy()
@@ -130,36 +258,53 @@ class GimPanel(Gtk.Window):
                                                        AppIndicator.IndicatorCategory.APPLICATION_STATUS)
         self.appindicator.set_status(AppIndicator.IndicatorStatus.ACTIVE)
         self.appindicator.connect('notify::icon-name', self.on_indicator_icon_changed)
+        # The items after the IMs are only built on idle
+        self._menu_built = False
+
+        # The indicator host shows the menu over dbusmenu without a "show"
+        # signal, Enable and show_popup_menu keep it in sync instead
         menu = Gtk.Menu()
         menu.connect('hide', self.on_indicator_menu_hide)
+        menu.show()
+
+        self.appindicator.set_menu(menu)
+
+    def _ensure_indicator_menu(self):
+        if self._menu_built:
+            return
 
-        menu.append(Gtk.SeparatorMenuItem())
+        self._menu_built = True
+        init_locale()
+        menu = self.appindicator.get_menu()
+        items = []
+
+        items.append(Gtk.SeparatorMenuItem())
 
         configure_menu = Gtk.MenuItem(_('Input Methods Preferences'))
         configure_menu.connect("activate", lambda *a: self._controller.Configure())
-        menu.append(configure_menu)
+        items.append(configure_menu)
 
         about_menu = Gtk.MenuItem(_('About'))
         about_menu.connect("activate", lambda *a: self.langpanel.on_about_clicked())
-        menu.append(about_menu)
+        items.append(about_menu)
 
-        menu.append(Gtk.SeparatorMenuItem())
+        items.append(Gtk.SeparatorMenuItem())
 
         item = Gtk.MenuItem(_('Quit'))
         item.connect('activate', self.on_gimpanel_exit)
-        menu.append(item)
-
-        self.non_im_items_index = - len(menu.get_children())
+        items.append(item)
 
-        menu.show_all()
+        for item in items:
+            menu.append(item)
+            item.show()
 
-        self.appindicator.set_menu(menu)
+        self.non_im_items_index = - len(items)
 
     def on_indicator_icon_changed(self, widget, prop):
         indicator_value = self.appindicator.get_property(prop.name)
         langpanel_value = self.langpanel.get_current_im_icon_name()
 
-        log.debug('on_indicator_icon_changed: %s/%s' % (indicator_value, langpanel_value))
+        log.debug('on_indicator_icon_changed: %s/%s', indicator_value, langpanel_value)
         if indicator_value != langpanel_value:
             self.appindicator.handler_block_by_func(self.on_indicator_icon_changed)
             self.appindicator.set_property(prop.name, langpanel_value)
@@ -167,10 +312,17 @@ class GimPanel(Gtk.Window):
 
     @log_func(log)
     def on_trigger_menu(self, widget):
+        # The user toggled an item, so re-check the items on the next sync
+        self._menu_dirty = True
+        self._pending_trigger = None
         if widget.get_active():
-            GObject.timeout_add(50, self._real_trigger_menu, widget)
+            if self._showing_popup:
+                # Wait for the local popup to go away and release its grab
+                self._pending_trigger = widget
+            else:
+                self._real_trigger_menu(widget)
         else:
-            log.info("%s menu is not active, no trigger menu" % widget._im)
+            log.info("%s menu is not active, no trigger menu", widget._im)
 
     @log_func(log)
     def on_indicator_menu_hide(self, widget):
@@ -178,13 +330,19 @@ class GimPanel(Gtk.Window):
         for item in widget.get_children()[self.non_im_items_index:]:
             item.show()
 
+        if self._pending_trigger:
+            self._real_trigger_menu(self._pending_trigger)
+            self._pending_trigger = None
+
     def _real_trigger_menu(self, widget):
-        log.error("TriggerProperty: %s" % widget._im)
+        log.debug("TriggerProperty: %s", widget._im)
         self._controller.TriggerProperty(widget._im)
 
     @log_func(log)
     def show_popup_menu(self, widget):
         self._showing_popup = True
+        self._ensure_indicator_menu()
+        self.update_menu()
         menu = self.appindicator.get_menu()
 
         for item in menu.get_children()[self.non_im_items_index:]:
@@ -194,34 +352,61 @@ class GimPanel(Gtk.Window):
 
     @log_func(log)
     def update_menu(self, args=None):
-        menu = self.appindicator.get_menu()
-
+        '''Sync the active IM item, which is only done when the items or the
+        current IM changed since the last sync'''
         if args:
-            for item in menu.get_children()[:self.non_im_items_index]:
-                item.destroy()
-
-            group_item = None
-            for i, arg in enumerate(args):
-                log.debug("menu item: %s" % arg)
-                item_name = arg.split(':')[1]
-                item = Gtk.RadioMenuItem(item_name)
-                item._im = arg.split(':')[0]
+            self._update_im_items(args)
+            self._menu_dirty = True
+
+        current_im = self.langpanel.get_current_im()
+        if not self._menu_dirty and current_im == self._menu_im:
+            return
+
+        self._menu_im = current_im
+        self._menu_dirty = False
+        for item in self._im_items.itervalues():
+            active = item.get_label() == current_im
+            if item.get_active() != active:
+                item.handler_block_by_func(self.on_trigger_menu)
+                item.set_active(active)
+                item.handler_unblock_by_func(self.on_trigger_menu)
+
+    def _update_im_items(self, args):
+        '''Keep the IM menu items keyed by the IM, reuse them and only add,
+        relabel, move or remove the ones which changed'''
+        menu = self.appindicator.get_menu()
+        fcitx_properties = [parse_property(arg) for arg in args]
+        keys = set(fcitx_property.key for fcitx_property in fcitx_properties)
+
+        for key in [key for key in self._im_items if key not in keys]:
+            log.debug("Remove menu item: %s", key)
+            self._im_items.pop(key).destroy()
+
+        group_item = next(self._im_items.itervalues(), None)
+        children = menu.get_children()
+        for i, fcitx_property in enumerate(fcitx_properties):
+            item = self._im_items.get(fcitx_property.key)
+
+            if item is None:
+                log.debug("Add menu item: %s", fcitx_property.key)
+                item = Gtk.RadioMenuItem(fcitx_property.label)
+                item._im = fcitx_property.key
                 if group_item:
                     item.set_property('group', group_item)
-                if i == 0:
+                else:
                     group_item = item
-                if self.langpanel.get_current_im() == item_name:
-                    item.set_active(True)
-
                 item.connect('activate', self.on_trigger_menu)
                 menu.insert(item, i)
+                item.show()
+                self._im_items[fcitx_property.key] = item
+                children = menu.get_children()
+            else:
+                if item.get_label() != fcitx_property.label:
+                    item.set_label(fcitx_property.label)
+                if children[i] is not item:
+                    menu.reorder_child(item, i)
+                    children = menu.get_children()
 
-            menu.show_all()
-        else:
-            for item in menu.get_children()[:self.non_im_items_index]:
-                item.handler_block_by_func(self.on_trigger_menu)
-                item.set_active(item.get_label() == self.langpanel.get_current_im())
-                item.handler_unblock_by_func(self.on_trigger_menu)
     @log_func(log)
     def ExecMenu(self, *args):
         if not self._showing_popup:
@@ -230,117 +415,257 @@ class GimPanel(Gtk.Window):
             log.info("Is showing popup menu, so no update_menu")
 
     def UpdatePreeditText(self, text, attr):
-        if self._preedit_label.get_text() != text:
-            self.set_resizable(False)
-            self._preedit_label.set_markup('<span color="#c131b5">%s</span>' % text)
+        self._preedit_text = text
+        self._preedit_attr = attr
+        self._mark_dirty('preedit')
 
     def UpdateAux(self, text, attr):
-        self._aux_label.set_markup('<span color="blue">%s</span>' % text)
+        self._aux_text = text
+        self._aux_attr = attr
+        self._mark_dirty('aux')
 
     def UpdateLookupTable(self, label, text,
                           attr, can_back, can_forward):
-        markup_text = []
-        highlight_first = (len(label) > 1)
-        self.set_resizable(True)
-
-        for i, index in enumerate(label):
-            if i == 0 and highlight_first:
-                markup_text.append("%s<span bgcolor='#f07746' fgcolor='white'>%s</span>" % (index, text[i].strip()))
-            elif i == 0:
-                markup_text.append("%s%s" % (index, text[i]))
-            else:
-                markup_text.append("     %s%s" % (index, text[i]))
+        self._lookup_table = (label, text, attr, can_back, can_forward)
+        self._mark_dirty('lookup')
 
-        self._lookup_label.set_markup(''.join(markup_text))
-
-        if can_back or can_forward:
-            #FIXME if set_sensitive to button, then the relief will be fixed. GTK+ bug?
-            self.look_back_button.get_child().set_sensitive(can_back)
-            self.look_forward_button.get_child().set_sensitive(can_forward)
-            self.look_back_button.show()
-            self.look_forward_button.show()
-            self._lookup_separator.show()
-        else:
-            self.look_back_button.hide()
-            self.look_forward_button.hide()
-            self._lookup_separator.hide()
+    def UpdateLookupTableCursor(self, cursor):
+        self._lookup_cursor = cursor
+        self._mark_dirty('lookup_cursor')
 
     def ShowPreedit(self, to_show):
         self._show_preedit = to_show
-        self._preedit_label.set_visible(self._show_preedit)
-        self._separator.set_visible(self._show_preedit)
         if not self._show_preedit:
-            self._preedit_label.set_text('')
+            self._preedit_text = ''
+            self._preedit_attr = ''
+        self._mark_dirty('preedit')
 
     def ShowLookupTable(self, to_show):
         self._show_lookup = to_show
         if not self._show_lookup:
-            self._lookup_label.set_text('')
+            self._lookup_table = None
+        self._mark_dirty('lookup')
 
     def ShowAux(self, to_show):
         self._show_aux = to_show
-        self._aux_label.set_visible(self._show_aux)
         if not self._show_aux:
-            self._aux_label.set_text('')
+            self._aux_text = ''
+            self._aux_attr = ''
+        self._mark_dirty('aux')
+
+    def _mark_dirty(self, *parts):
+        self._dirty.update(parts)
+        self.dirty_marks += 1
+
+    def queue_render(self):
+        '''Apply the pending state once per frame: in the update phase of the
+        frame clock while the window is shown, else on the next main loop
+        iteration. All the signals until then only cost one render pass.'''
+        self.queued_updates += 1
+        if self._render_id or self._frame_requested:
+            self.collapsed_updates += 1
+            return
+
+        if self.get_mapped():
+            self._frame_requested = True
+            self.get_frame_clock().request_phase(Gdk.FrameClockPhase.UPDATE)
+        else:
+            self._render_id = GObject.idle_add(self._render_pending)
+
+    def on_frame_clock_update(self, frame_clock):
+        if self._frame_requested:
+            self._render_pending()
+
+    def _render_pending(self):
+        started = GLib.get_monotonic_time()
+        self._render_id = 0
+        self._frame_requested = False
+        dirty, self._dirty = self._dirty, set()
+
+        if 'preedit' in dirty:
+            self._render_preedit()
+        if 'aux' in dirty:
+            self._render_aux()
+        if 'lookup' in dirty:
+            self._render_lookup_table()
+        elif 'lookup_cursor' in dirty:
+            self._candidate_view.set_highlight(self._lookup_cursor)
+
+        # Place the window for the new content and cursor before it is shown,
+        # so it is moved once instead of after every size-allocate
+        if dirty:
+            self._update_width()
+        if dirty and self.has_content():
+            self._move_position(*self._predict_size())
+        self.do_visible_task()
+        if not dirty or not self.get_visible():
+            self._controller.discard_unpainted()
+
+        self._controller.latency.record('Panel', 'render',
+                                        GLib.get_monotonic_time() - started)
+        return False
+
+    def _render_preedit(self):
+        self._preedit_label.set_visible(self._show_preedit)
+        self._separator.set_visible(self._show_preedit)
+
+        preedit = (self._preedit_text, self._preedit_attr)
+        if preedit != self._rendered_preedit:
+            self._rendered_preedit = preedit
+            set_label_text(self._preedit_label, self._preedit_text,
+                           build_attr_list(self._preedit_text, self._preedit_attr,
+                                           foreground=PREEDIT_COLOR))
+
+    def _render_aux(self):
+        self._aux_label.set_visible(self._show_aux)
+        set_label_text(self._aux_label, self._aux_text,
+                       build_attr_list(self._aux_text, self._aux_attr,
+                                       foreground=AUX_COLOR))
+
+    def _render_lookup_table(self):
+        if not self._lookup_table:
+            self._candidate_view.clear()
+            return
+
+        label, text, attr, can_back, can_forward = self._lookup_table
+        self._candidate_view.set_candidates(label, text, attr, self._lookup_cursor)
+
+        if can_back or can_forward:
+            #FIXME if set_sensitive to button, then the relief will be fixed. GTK+ bug?
+            self.look_back_button.get_child().set_sensitive(can_back)
+            self.look_forward_button.get_child().set_sensitive(can_forward)
+            self.look_back_button.show()
+            self.look_forward_button.show()
+            self._lookup_separator.show()
+        else:
+            self.look_back_button.hide()
+            self.look_forward_button.hide()
+            self._lookup_separator.hide()
 
     @log_func(log)
     def RegisterProperties(self, args):
         if not self._showing_popup:
-            self.langpanel.reset_toolbar_items()
+            fcitx_properties = {}
 
             for arg in args:
-                prop_name = arg.split(':')[0]
+                fcitx_property = parse_property(arg)
+                if not fcitx_property:
+                    continue
 
-                if prop_name in self.langpanel.fcitx_prop_dict.keys():
-                    setattr(self.langpanel, self.langpanel.fcitx_prop_dict[prop_name], arg)
+                prop_name = self.langpanel.fcitx_prop_dict.get(fcitx_property.key)
+                if prop_name:
+                    fcitx_properties[prop_name] = fcitx_property
                 else:
-                    log.warning('RegisterProperties: No handle prop name: %s' % prop_name)
+                    log.warning('RegisterProperties: No handle prop name: %s', fcitx_property.key)
+
+            changed = self.langpanel.set_toolbar_items(fcitx_properties)
+            log.debug('RegisterProperties: changed items: %s', changed)
         else:
             log.info('Stop RegisterProperties: because of showing popup menu')
 
     def UpdateProperty(self, value):
-        prop_name = value.split(':')[0]
-        icon_name = value.split(':')[2]
+        fcitx_property = parse_property(value)
+        prop_name = fcitx_property.key if fcitx_property else ''
 
-        if prop_name in self.langpanel.fcitx_prop_dict.keys() and \
+        if prop_name in self.langpanel.fcitx_prop_dict and \
                 not self._showing_popup:
-            log.debug('UpdateProperty: prop name: %s for value: %s' % (prop_name, icon_name))
-            self.appindicator.set_property("icon-name", icon_name)
-            setattr(self.langpanel, self.langpanel.fcitx_prop_dict[prop_name], value)
+            log.debug('UpdateProperty: prop name: %s for value: %s', prop_name, fcitx_property.icon)
+            # The indicator host looks the name up again on every change
+            if self.appindicator.get_property("icon-name") != fcitx_property.icon:
+                self.appindicator.set_property("icon-name", fcitx_property.icon)
+            self.langpanel.set_toolbar_item(self.langpanel.fcitx_prop_dict[prop_name],
+                                            fcitx_property)
             self.Enable(1)
         else:
-            log.warning('UpdateProperty: No handle prop name: %s or is showing popup menu' % prop_name)
+            log.warning('UpdateProperty: No handle prop name: %s or is showing popup menu', prop_name)
 
     @log_func(log)
     def Enable(self, enabled):
-        log.debug("Enable: %s, showing popup: %s, is default: %s" % (enabled, self._showing_popup, self.langpanel.is_default_im()))
+        is_default_im = self.langpanel.is_default_im()
+        log.debug("Enable: %s, showing popup: %s, is default: %s",
+                  enabled, self._showing_popup, is_default_im)
         self.update_menu()
-        self.langpanel.visible = (enabled == 1 and not self.langpanel.is_default_im()) or self._showing_popup
+        self.langpanel.visible = (enabled == 1 and not is_default_im) or self._showing_popup
         self.langpanel.do_visible_task()
 
-    def do_visible_task(self):
-        if self._preedit_label.get_text() or \
-           self._aux_label.get_text() or \
-           self._lookup_label.get_text():
-            self.set_visible(True)
-        else:
-            self.set_visible(False)
-
-    def _move_position(self):
-        window_right = self._cursor_x + self.get_allocation().width
-        window_bottom = self._cursor_y + self._cursor_h + self.get_allocation().height
+    def has_content(self):
+        return bool(self._preedit_label.get_text() or \
+                    self._aux_label.get_text() or \
+                    not self._candidate_view.is_empty())
 
-        root_window = Gdk.get_default_root_window()
-        screen_width, screen_height = root_window.get_width(), root_window.get_height()
-        if window_right > screen_width:
-            x = screen_width - self.get_allocation().width
-        else:
-            x = self._cursor_x
-
-        if window_bottom > screen_height:
-            y = self._cursor_y - self.get_allocation().height
-        else:
-            y = self._cursor_y + self._cursor_h
-
-        log.debug("Move gimpanel to %sx%s" % (x, y))
-        self.move(x, y)
+    def do_visible_task(self):
+        visible = self.has_content()
+        if not visible:
+            # The window may be dragged away while shown, place it again
+            self._last_position = None
+        self._visibility.set_visible(visible)
+
+    def set_spot_rect(self, x, y, w, h):
+        '''The cursor moved, the window is placed in the next render pass'''
+        if (x, y, h) == (self._cursor_x, self._cursor_y, self._cursor_h):
+            return
+
+        self._cursor_x = x
+        self._cursor_y = y
+        self._cursor_h = h
+        self._mark_dirty('position')
+        self.queue_render()
+
+    def _predict_size(self):
+        '''The size the window will get for the current content, measured
+        from the size request of the labels'''
+        minimum, natural = self.get_preferred_size()
+        return natural.width, natural.height
+
+    def _get_content_width(self):
+        '''The width needed by the content, rounded up to WIDTH_STEP'''
+        minimum, natural = self.get_child().get_preferred_width()
+        width = natural + 2 * self.get_border_width()
+
+        return max(MIN_WIDTH, int(math.ceil(width / float(WIDTH_STEP))) * WIDTH_STEP)
+
+    def _set_width(self, width):
+        if width != self._width:
+            self._width = width
+            self.set_size_request(width, -1)
+
+    def _cancel_shrink(self):
+        if self._shrink_id:
+            GObject.source_remove(self._shrink_id)
+            self._shrink_id = 0
+        self._shrink_due = False
+
+    def _update_width(self):
+        '''Grow the window width at once in WIDTH_STEP steps, but only shrink
+        it after SHRINK_DELAY or when the lookup table is gone, so typing
+        does not resize the window on every keystroke'''
+        width = self._get_content_width()
+
+        if width >= self._width or self._lookup_table is None or self._shrink_due:
+            self._cancel_shrink()
+            self._set_width(width)
+        elif not self._shrink_id:
+            self._shrink_id = GObject.timeout_add(SHRINK_DELAY, self._on_shrink_timeout)
+
+    def _on_shrink_timeout(self):
+        # The shrink is applied by the next render pass, like any other change
+        self._shrink_id = 0
+        self._shrink_due = True
+        self._mark_dirty('width')
+        self.queue_render()
+        return False
+
+    def on_size_allocate(self, widget, allocation):
+        # Only moves if the predicted size was wrong
+        self._move_position(allocation.width, allocation.height)
+
+    def _move_position(self, width, height):
+        workarea = get_monitor_geometry().get_workarea_at(self._cursor_x,
+                                                          self._cursor_y)
+        position = place_at_cursor(self._cursor_x, self._cursor_y, self._cursor_h,
+                                   width, height, workarea)
+
+        if position != self._last_position:
+            self._last_position = position
+            log.debug("Move gimpanel to %sx%s", *position)
+            self.move(*position)
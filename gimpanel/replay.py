@@ -0,0 +1,177 @@
+'''Replay a kimpanel signal trace recorded with "fcitx-gimpanel --record"
+into a GimPanel running on a private session bus, and report the timing
+
+    python -m gimpanel.replay [--fast] [--direct] [--backend BACKEND] TRACE
+'''
+import os
+import sys
+import time
+import signal
+import optparse
+import subprocess
+
+import dbus
+import dbus.lowlevel
+import dbus.mainloop.glib
+
+from gi.repository import Gtk, Gio
+
+from gimpanel.controller import KIMPANEL_SIGNALS
+from gimpanel.trace import read_trace
+
+BACKENDS = ('gdbus', 'dbus-python')
+
+
+def start_private_bus():
+    '''Start a private dbus-daemon, return (process, address)'''
+    process = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                                '--print-address=1'],
+                               stdout=subprocess.PIPE)
+    address = process.stdout.readline().strip()
+    if not address:
+        process.kill()
+        raise RuntimeError('Failed to start the private dbus-daemon')
+
+    return process, address
+
+
+def stop_private_bus(process):
+    if process.poll() is None:
+        os.kill(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+def run_pending_events():
+    while Gtk.events_pending():
+        Gtk.main_iteration_do(False)
+
+
+def wait_until(deadline):
+    '''Keep the main loop running until the deadline'''
+    while time.time() < deadline:
+        if Gtk.events_pending():
+            Gtk.main_iteration_do(False)
+        else:
+            time.sleep(0.0005)
+
+
+def connect_bus(address, backend):
+    '''Connect the panel side to the bus with the gdbus or dbus-python backend'''
+    if backend == 'gdbus':
+        flags = Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | \
+                Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION
+        return Gio.DBusConnection.new_for_address_sync(address, flags, None, None)
+    else:
+        return dbus.bus.BusConnection(address)
+
+
+class BusDispatcher(object):
+    '''Send the trace to the panel as real D-Bus messages'''
+    def __init__(self, address):
+        self._bus = dbus.bus.BusConnection(address)
+
+    def __call__(self, controller, name, args):
+        if name == 'SetSpotRect':
+            message = dbus.lowlevel.MethodCallMessage('org.kde.impanel',
+                                                      '/org/kde/impanel',
+                                                      'org.kde.impanel2',
+                                                      name)
+            message.set_no_reply(True)
+            message.append(signature='iiii', *args)
+        else:
+            message = dbus.lowlevel.SignalMessage('/kimpanel',
+                                                  'org.kde.kimpanel.inputmethod',
+                                                  name)
+            if name in KIMPANEL_SIGNALS:
+                message.append(signature=''.join(KIMPANEL_SIGNALS[name]), *args)
+
+        self._bus.send_message(message)
+
+
+def direct_dispatch(controller, name, args):
+    '''Call the controller as if the message came from the bus'''
+    if name == 'SetSpotRect':
+        controller.set_spot_rect(*args)
+    else:
+        controller.signal_handler(*args, member=name)
+
+
+def replay(panel, events, dispatch, realtime=True):
+    '''Feed the events to the panel, return the wall time of the replay'''
+    controller = panel._controller
+    controller.latency.reset()
+    panel.queued_updates = panel.collapsed_updates = 0
+
+    start = time.time()
+    for timestamp, name, args in events:
+        if realtime:
+            wait_until(start + timestamp)
+        dispatch(controller, name, args)
+        run_pending_events()
+
+    # Let the last signals reach the panel and be rendered
+    wait_until(time.time() + 0.1)
+
+    return time.time() - start
+
+
+def format_report(panel, events, elapsed):
+    controller = panel._controller
+    n_signals = sum(1 for e in events if e[1] != 'SetSpotRect')
+
+    lines = ['Replayed %d signals in %.3fs: %.1f signals/s' %
+             (n_signals, elapsed, n_signals / elapsed if elapsed else 0)]
+    lines.append('%-26s %8s %10s %8s %8s %8s' %
+                 ('signal', 'count', 'total(us)', 'p50', 'p95', 'max'))
+
+    for signal_name in sorted(controller.get_signal_counts()):
+        histogram = controller.latency.get(signal_name, 'handle')
+        if histogram and histogram.count:
+            count, p50, p95, p99, max_value = histogram.summary()
+            lines.append('%-26s %8d %10d %8d %8d %8d' %
+                         (signal_name, count, histogram.total, p50, p95, max_value))
+
+    render = controller.latency.get('Panel', 'render')
+    if render:
+        lines.append('Render: %d passes, %.3fms total, %d updates collapsed' %
+                     (render.count, render.total / 1000.0, panel.collapsed_updates))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options] TRACE')
+    parser.add_option('--fast', action='store_true', default=False,
+                      help='Replay as fast as possible instead of the original speed')
+    parser.add_option('--direct', action='store_true', default=False,
+                      help='Call the controller directly instead of going through D-Bus')
+    parser.add_option('--backend', choices=BACKENDS, default=BACKENDS[0],
+                      help='The D-Bus backend of the panel: %s' % ', '.join(BACKENDS))
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('Need a trace file')
+
+    events = list(read_trace(args[0]))
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus_process, address = start_private_bus()
+    try:
+        from gimpanel.main import GimPanel
+
+        panel = GimPanel(connect_bus(address, options.backend))
+        panel.show_all()
+        run_pending_events()
+
+        if options.direct:
+            dispatch = direct_dispatch
+        else:
+            dispatch = BusDispatcher(address)
+
+        elapsed = replay(panel, events, dispatch, realtime=not options.fast)
+        print format_report(panel, events, elapsed)
+    finally:
+        stop_private_bus(bus_process)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
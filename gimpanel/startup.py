@@ -0,0 +1,31 @@
+import sys
+import time
+
+class StartupProfile(object):
+    '''The wall time of each startup phase, printed with --startup-profile'''
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self, start=None):
+        self._start = self._last = start or time.time()
+        self.phases = []
+
+    def mark(self, phase):
+        '''The phase ended now, it started when the previous one ended'''
+        now = time.time()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, stream=None):
+        if not self.enabled:
+            return
+
+        stream = stream or sys.stderr
+        for phase, elapsed in self.phases:
+            stream.write('%-16s %8.1fms\n' % (phase, elapsed * 1000))
+        stream.write('%-16s %8.1fms\n' % ('total', (self._last - self._start) * 1000))
+        stream.flush()
+
+
+startup_profile = StartupProfile()
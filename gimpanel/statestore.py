@@ -0,0 +1,93 @@
+import os
+import time
+import atexit
+import logging
+import tempfile
+import threading
+
+log = logging.getLogger('StateStore')
+
+# Read once here, os.umask can only be read by setting it for the process
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def atomic_write(path, content):
+    '''Write to a temp file in the same directory, fsync it and rename it over
+    the path, so a crash leaves either the old or the new file. A symlink is
+    followed and the mode of the existing file is kept.'''
+    path = os.path.realpath(path)
+    try:
+        mode = os.stat(path).st_mode & 07777
+    except OSError:
+        mode = 0666 & ~_UMASK
+
+    fd, temp_path = tempfile.mkstemp(prefix='.%s.' % os.path.basename(path),
+                                     dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class WriteBehindStore(object):
+    '''Batch the file writes and do them on a background thread once no
+    change came in for the delay. Only the last content of a path is written.'''
+    def __init__(self, delay=0.5):
+        self._delay = delay
+        self._pending = {}
+        self._deadline = 0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+        atexit.register(self.flush)
+
+    def write(self, path, content, callback=None):
+        '''Schedule the write of content to path, callback(path) is called from
+        the writer thread once it is on disk'''
+        with self._condition:
+            self._pending[path] = (content, callback)
+            self._deadline = time.time() + self._delay
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='GimPanelStateStore')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                remaining = self._deadline - time.time()
+                while remaining > 0:
+                    self._condition.wait(remaining)
+                    remaining = self._deadline - time.time()
+
+            self.flush()
+
+    def flush(self):
+        '''Write the pending changes now, in the calling thread'''
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+
+            for path, (content, callback) in pending.iteritems():
+                try:
+                    atomic_write(path, content)
+                    if callback:
+                        callback(path)
+                except Exception:
+                    log.exception("Failed to write %s", path)
+
+
+state_store = WriteBehindStore()
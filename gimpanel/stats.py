@@ -0,0 +1,76 @@
+import math
+import bisect
+
+class LatencyHistogram(object):
+    '''Latency samples in microseconds, counted in exponential buckets'''
+    BUCKET_BASE = 10
+    BUCKET_GROWTH = 1.25
+    N_BUCKETS = 64
+
+    BOUNDS = [int(math.ceil(BUCKET_BASE * BUCKET_GROWTH ** i))
+              for i in range(N_BUCKETS)]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._buckets = [0] * (self.N_BUCKETS + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self._buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        '''Return the upper bound of the bucket holding the given percentile,
+        never more than the max seen value'''
+        if not self.count:
+            return 0
+
+        target = int(math.ceil(self.count * percent / 100.0))
+        seen = 0
+        for i, n in enumerate(self._buckets):
+            seen += n
+            if seen >= target:
+                if i < self.N_BUCKETS:
+                    return min(self.BOUNDS[i], self.max)
+                break
+
+        return self.max
+
+    def summary(self):
+        '''Return (count, p50, p95, p99, max)'''
+        return (self.count, self.percentile(50), self.percentile(95),
+                self.percentile(99), self.max)
+
+
+class LatencyStats(object):
+    '''Per signal latency histograms, for each stage of the signal handling'''
+    STAGES = ('handle', 'paint', 'render', 'show', 'hide')
+
+    def __init__(self):
+        self._histograms = {}
+
+    def get(self, signal_name, stage):
+        return self._histograms.get((signal_name, stage))
+
+    def record(self, signal_name, stage, value):
+        try:
+            histogram = self._histograms[signal_name, stage]
+        except KeyError:
+            histogram = self._histograms[signal_name, stage] = LatencyHistogram()
+
+        histogram.add(value)
+
+    def summary(self):
+        '''Return a dict of "signal_name:stage" to (count, p50, p95, p99, max)'''
+        return dict(('%s:%s' % key, histogram.summary())
+                    for key, histogram in self._histograms.iteritems())
+
+    def reset(self):
+        self._histograms.clear()
@@ -0,0 +1,111 @@
+import logging
+
+from gi.repository import Pango
+
+log = logging.getLogger('TextAttr')
+
+# The attribute types used by kimpanel, the attr string of a text is a list of
+# "type:start:length:value" separated by ";"
+ATTR_NONE, ATTR_DECORATE, ATTR_FOREGROUND, ATTR_BACKGROUND = range(4)
+
+DECORATE_UNDERLINE = 1
+DECORATE_HIGHLIGHT = 2
+DECORATE_REVERSE = 4
+
+HIGHLIGHT_FOREGROUND = 'white'
+HIGHLIGHT_BACKGROUND = '#f07746'
+
+_color_cache = {}
+
+def parse_attrs(attr):
+    '''Parse the kimpanel attr string to a list of (type, start, length, value)'''
+    attrs = []
+    if not attr:
+        return attrs
+
+    for item in attr.split(';'):
+        fields = item.split(':')
+        if len(fields) < 4:
+            continue
+        try:
+            attrs.append(tuple(int(field) for field in fields[:4]))
+        except ValueError:
+            log.warning("Invalid text attribute: %s", item)
+
+    return attrs
+
+
+def _parse_color(color):
+    '''Return the 16 bits (red, green, blue) of a color name or an int 0xRRGGBB'''
+    try:
+        return _color_cache[color]
+    except KeyError:
+        pass
+
+    if isinstance(color, (int, long)):
+        rgb = tuple(((color >> shift) & 0xff) * 257 for shift in (16, 8, 0))
+    else:
+        pango_color = Pango.Color()
+        pango_color.parse(color)
+        rgb = pango_color.red, pango_color.green, pango_color.blue
+
+    _color_cache[color] = rgb
+    return rgb
+
+
+def _byte_index(text, index):
+    '''Pango works on the UTF-8 byte index, but kimpanel sends char index'''
+    return len(text[:index].encode('utf-8'))
+
+
+def _insert(attr_list, attribute, text, start, end):
+    attribute.start_index = _byte_index(text, start)
+    attribute.end_index = _byte_index(text, end)
+    attr_list.insert(attribute)
+
+
+def _insert_colors(attr_list, text, start, end, foreground=None, background=None):
+    if foreground is not None:
+        _insert(attr_list, Pango.attr_foreground_new(*_parse_color(foreground)),
+                text, start, end)
+    if background is not None:
+        _insert(attr_list, Pango.attr_background_new(*_parse_color(background)),
+                text, start, end)
+
+
+def build_attr_list(text, attr='', offset=0, foreground=None, spans=()):
+    '''Build a Pango.AttrList for text without going through markup
+
+    attr is the kimpanel attr string, its indexes are shifted by offset.
+    foreground is the color of the whole text, and spans is a list of
+    (start, end, foreground, background) to color parts of the text.
+    '''
+    attr_list = Pango.AttrList()
+    _insert_colors(attr_list, text, 0, len(text), foreground)
+
+    for start, end, span_foreground, span_background in spans:
+        _insert_colors(attr_list, text, start, end,
+                       span_foreground, span_background)
+
+    for attr_type, start, length, value in parse_attrs(attr):
+        start += offset
+        end = start + length
+        if attr_type == ATTR_FOREGROUND:
+            _insert_colors(attr_list, text, start, end, foreground=value)
+        elif attr_type == ATTR_BACKGROUND:
+            _insert_colors(attr_list, text, start, end, background=value)
+        elif attr_type == ATTR_DECORATE:
+            if value & DECORATE_UNDERLINE:
+                _insert(attr_list, Pango.attr_underline_new(Pango.Underline.SINGLE),
+                        text, start, end)
+            if value & (DECORATE_HIGHLIGHT | DECORATE_REVERSE):
+                _insert_colors(attr_list, text, start, end,
+                               HIGHLIGHT_FOREGROUND, HIGHLIGHT_BACKGROUND)
+
+    return attr_list
+
+
+def set_label_text(label, text, attr_list):
+    '''Set plain text with its attributes, no markup is parsed'''
+    label.set_attributes(attr_list)
+    label.set_text(text)
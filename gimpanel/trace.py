@@ -0,0 +1,39 @@
+import json
+import time
+import logging
+
+log = logging.getLogger('Trace')
+
+TRACE_VERSION = 1
+
+class TraceRecorder(object):
+    '''Write the kimpanel signals and SetSpotRect calls to a trace file, one
+    compact JSON list [seconds since start, name, args] per line'''
+    def __init__(self, path):
+        self._file = open(path, 'w')
+        self._start = time.time()
+        self._write({'version': TRACE_VERSION, 'start': self._start})
+
+    def _write(self, item):
+        self._file.write(json.dumps(item, separators=(',', ':')))
+        self._file.write('\n')
+
+    def record(self, name, args):
+        self._write([round(time.time() - self._start, 6), name, args])
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_trace(path):
+    '''Yield (seconds since start, name, args) from a trace file'''
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError('Unsupported trace version: %s' % header.get('version'))
+
+        for line in f:
+            if line.strip():
+                timestamp, name, args = json.loads(line)
+                yield timestamp, name, args
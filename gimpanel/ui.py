@@ -1,10 +1,18 @@
 from gi.repository import Gtk, Gdk, GObject
 
+from gimpanel.textattr import build_attr_list, set_label_text
+from gimpanel.textattr import HIGHLIGHT_FOREGROUND, HIGHLIGHT_BACKGROUND
+
 
 class Handle(Gtk.EventBox):
+    '''Drag the toplevel window, move-end reports its final position once.
+
+    The panels are POPUP windows which the window manager does not manage,
+    so begin_move_drag() can not be used, the window is moved at most once
+    per frame instead.'''
     __gsignals__ = {
         "move-begin": (GObject.SignalFlags.RUN_LAST, None, ()),
-        "move-end": (GObject.SignalFlags.RUN_LAST, None, ()),
+        "move-end": (GObject.SignalFlags.RUN_LAST, None, (int, int)),
     }
 
     def __init__ (self):
@@ -18,36 +26,66 @@ class Handle(Gtk.EventBox):
                         Gdk.EventMask.BUTTON1_MOTION_MASK)
 
         self._move_begined = False
+        self._press_pos = 0, 0
+        self._position = None
+        self._target = None
+        self._tick_id = 0
 
     def do_button_press_event(self, event):
-        if event.button == 1:
-            self._move_begined = True
-            toplevel = self.get_toplevel()
-            x, y = toplevel.get_position()
-            self._press_pos = event.x_root - x, event.y_root - y
-            self.get_parent_window().set_cursor(Gdk.Cursor.new(Gdk.CursorType.FLEUR))
-            self.emit("move-begin")
-            return True
-        return False
+        if event.button != 1 or self._move_begined:
+            return False
+
+        self._move_begined = True
+        self._position = x, y = self.get_toplevel().get_position()
+        self._press_pos = event.x_root - x, event.y_root - y
+        self.get_parent_window().set_cursor(Gdk.Cursor.new(Gdk.CursorType.FLEUR))
+        self.emit("move-begin")
+        return True
 
     def do_button_release_event(self, event):
-        if event.button == 1:
-            self._move_begined = False
-            self.get_parent_window().set_cursor(Gdk.Cursor.new(Gdk.CursorType.LEFT_PTR))
-            self.emit("move-end")
-            return True
+        if event.button != 1 or not self._move_begined:
+            return False
 
+        self._end_move()
+        return True
+
+    def do_grab_broken_event(self, event):
+        # The release will not come, e.g. another client grabbed the pointer
+        if self._move_begined:
+            self._end_move()
         return False
 
     def do_motion_notify_event(self, event):
         if not self._move_begined:
-            return
-        toplevel = self.get_toplevel()
-        x, y = toplevel.get_position()
-        x  = int(event.x_root - self._press_pos[0])
-        y  = int(event.y_root - self._press_pos[1])
+            return False
 
-        toplevel.move(x, y)
+        # Only remember the target, the window is moved once per frame
+        self._target = (int(event.x_root - self._press_pos[0]),
+                        int(event.y_root - self._press_pos[1]))
+        if not self._tick_id:
+            self._tick_id = self.add_tick_callback(self._on_tick, None)
+        return True
+
+    def _on_tick(self, widget, frame_clock, data):
+        self._tick_id = 0
+        self._flush_move()
+        return False
+
+    def _flush_move(self):
+        if self._tick_id:
+            self.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+
+        if self._target is not None and self._target != self._position:
+            self.get_toplevel().move(*self._target)
+            self._position = self._target
+        self._target = None
+
+    def _end_move(self):
+        self._flush_move()
+        self._move_begined = False
+        self.get_parent_window().set_cursor(Gdk.Cursor.new(Gdk.CursorType.LEFT_PTR))
+        self.emit("move-end", *self._position)
 
     def do_draw(self, cr):
         context = self.get_style_context()
@@ -64,3 +102,74 @@ class Handle(Gtk.EventBox):
         context.restore()
 
         return False
+
+
+class CandidateView(Gtk.Box):
+    '''A row of candidate cells, only the cells which changed since the
+    previous page are updated'''
+
+    def __init__(self, spacing=12):
+        super(CandidateView, self).__init__(orientation=Gtk.Orientation.HORIZONTAL,
+                                            spacing=spacing)
+        self._cells = []
+        self._page = ()
+        self._highlight = -1
+
+    def _get_cell(self, i):
+        while len(self._cells) <= i:
+            cell = Gtk.Label()
+            cell.set_alignment(0, 0.5)
+            self.pack_start(cell, False, False, 0)
+            self._cells.append(cell)
+
+        return self._cells[i]
+
+    def _render_cell(self, i):
+        index, text, attr = self._page[i]
+        cell = self._get_cell(i)
+
+        if i == self._highlight:
+            text = text.strip()
+            spans = ((len(index), len(index) + len(text),
+                      HIGHLIGHT_FOREGROUND, HIGHLIGHT_BACKGROUND),)
+        else:
+            spans = ()
+
+        cell_text = index + text
+        set_label_text(cell, cell_text,
+                       build_attr_list(cell_text, attr, offset=len(index), spans=spans))
+        cell.show()
+
+    def set_candidates(self, labels, texts, attrs=(), highlight=0):
+        '''Show a page of candidates'''
+        page = tuple((label, text, attrs[i] if i < len(attrs) else '')
+                     for i, (label, text) in enumerate(zip(labels, texts)))
+        if len(page) <= 1:
+            highlight = -1
+
+        old_page, old_highlight = self._page, self._highlight
+        self._page, self._highlight = page, highlight
+
+        for i in xrange(len(page)):
+            if i >= len(old_page) or page[i] != old_page[i] or \
+               i in (highlight, old_highlight):
+                self._render_cell(i)
+
+        for cell in self._cells[len(page):len(old_page)]:
+            cell.hide()
+
+    def set_highlight(self, highlight):
+        '''Only move the highlighted candidate, leaving the others as is'''
+        if highlight == self._highlight or len(self._page) <= 1:
+            return
+
+        old_highlight, self._highlight = self._highlight, highlight
+        for i in (old_highlight, highlight):
+            if 0 <= i < len(self._page):
+                self._render_cell(i)
+
+    def clear(self):
+        self.set_candidates((), ())
+
+    def is_empty(self):
+        return not self._page
@@ -0,0 +1,88 @@
+import logging
+
+from gi.repository import GLib, GObject
+
+log = logging.getLogger('Visibility')
+
+HIDDEN, PENDING_SHOW, SHOWN, PENDING_HIDE = range(4)
+STATE_NAMES = ('hidden', 'pending-show', 'shown', 'pending-hide')
+
+class VisibilityController(object):
+    '''Drive the visibility of a window through explicit states.
+
+    A show is applied at once unless show_delay is set, a hide waits for
+    hide_delay (ms) and is cancelled if a show comes in meanwhile, so a quick
+    hide/show does not flicker. The time from a request until the window
+    really changed is recorded to stats as "name:show" and "name:hide".
+    '''
+    def __init__(self, window, name, show_delay=0, hide_delay=0, stats=None):
+        self._window = window
+        self._name = name
+        self.show_delay = show_delay
+        self.hide_delay = hide_delay
+        self._stats = stats
+
+        self.state = SHOWN if window.get_visible() else HIDDEN
+        self._timeout_id = 0
+        self._requested = 0
+
+    def set_visible(self, visible):
+        if self.state in (HIDDEN, SHOWN):
+            # The window may have been shown or hidden directly, e.g. show_all
+            self.state = SHOWN if self._window.get_visible() else HIDDEN
+
+        if visible:
+            if self.state == PENDING_HIDE:
+                self._cancel()
+                self._set_state(SHOWN)
+            elif self.state == HIDDEN:
+                self._request(PENDING_SHOW, self.show_delay)
+        else:
+            if self.state == PENDING_SHOW:
+                self._cancel()
+                self._set_state(HIDDEN)
+            elif self.state == SHOWN:
+                self._request(PENDING_HIDE, self.hide_delay)
+
+    def flush(self):
+        '''Apply a pending transition now'''
+        if self.state in (PENDING_SHOW, PENDING_HIDE):
+            self._cancel()
+            self._apply()
+
+    def _set_state(self, state):
+        log.debug("%s: %s -> %s", self._name, STATE_NAMES[self.state], STATE_NAMES[state])
+        self.state = state
+
+    def _request(self, state, delay):
+        self._requested = GLib.get_monotonic_time()
+        self._set_state(state)
+
+        if delay:
+            self._timeout_id = GObject.timeout_add(delay, self._on_timeout)
+        else:
+            self._apply()
+
+    def _cancel(self):
+        if self._timeout_id:
+            GObject.source_remove(self._timeout_id)
+            self._timeout_id = 0
+
+    def _on_timeout(self):
+        self._timeout_id = 0
+        self._apply()
+        return False
+
+    def _apply(self):
+        if self.state == PENDING_SHOW:
+            self._window.show()
+            self._set_state(SHOWN)
+            stage = 'show'
+        else:
+            self._window.hide()
+            self._set_state(HIDDEN)
+            stage = 'hide'
+
+        if self._stats:
+            self._stats.record(self._name, stage,
+                               GLib.get_monotonic_time() - self._requested)
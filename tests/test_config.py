@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from gimpanel.config import ConfigSetting, fcitx_config
+from gimpanel.config import ConfigSetting, FcitxConfig, fcitx_config, parse_literal
 from gimpanel.common import CONFIG_ROOT
 
 
@@ -13,6 +13,18 @@ class TestConfigSettingFunctions(unittest.TestCase):
         self.assertEqual('wubi', self.config_profile.get_value('Profile', 'IMName'))
         self.assertEqual(['fcitx-keyboard-us', 'wubi', 'wbpy'], fcitx_config.get_enabled_ims())
 
+    def test_parse_literal(self):
+        self.assertEqual(True, parse_literal('True'))
+        self.assertEqual(False, parse_literal('false'))
+        self.assertEqual('wubi', parse_literal('"wubi"'))
+        self.assertEqual("__import__('os')", parse_literal("__import__('os')"))
+
+    def test_parse_enabled_ims(self):
+        self.assertEqual(['fcitx-keyboard-us', 'wbpy'],
+                         FcitxConfig.parse_enabled_ims('fcitx-keyboard-us:True,'
+                                                       'wubi:False,wbpy:True'))
+        self.assertEqual([], FcitxConfig.parse_enabled_ims(''))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from gimpanel import controller
+from gimpanel.controller import BaseController, UNHANDLED_LOG_INTERVAL
+
+
+class FakePanel(object):
+    def __init__(self):
+        self.dirty_marks = 0
+        self.renders = 0
+        self.aux = []
+
+    def UpdateAux(self, text, attr):
+        self.aux.append((text, attr))
+        self.dirty_marks += 1
+
+    def queue_render(self):
+        self.renders += 1
+
+
+class FakeLog(object):
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message, *args):
+        self.warnings.append(message % args)
+
+    def debug(self, message, *args):
+        pass
+
+
+class TestControllerFunctions(unittest.TestCase):
+    def setUp(self):
+        self.panel = FakePanel()
+        self.controller = BaseController(self.panel)
+
+    def test_dispatch(self):
+        self.controller.signal_handler(u'pinyin', u'', member='UpdateAux')
+        self.controller.signal_handler(u'ni', u'', member='UpdateAux')
+
+        self.assertEqual([(u'pinyin', u''), (u'ni', u'')], self.panel.aux)
+        self.assertEqual(2, self.panel.renders)
+        self.assertEqual(2, self.controller.get_signal_counts()['UpdateAux'])
+        self.assertEqual(0, self.controller.get_signal_counts()['Enable'])
+        self.assertEqual(2, self.controller.latency.get('UpdateAux', 'handle').count)
+
+    def test_unknown_signal(self):
+        self.controller.signal_handler(u'x', member='UnknownSignal')
+
+        self.assertEqual(1, self.controller.get_signal_counts()['UnknownSignal'])
+        self.assertEqual(1, self.panel.renders)
+
+    def test_argument_count_mismatch(self):
+        self.controller.signal_handler(u'pinyin', member='UpdateAux')
+
+        self.assertEqual([], self.panel.aux)
+        self.assertEqual(1, self.controller.get_signal_counts()['UpdateAux'])
+        self.assertEqual(1, self.panel.renders)
+
+    def test_unhandled_log_interval(self):
+        fake_log = FakeLog()
+        real_log, controller.log = controller.log, fake_log
+        try:
+            for i in range(UNHANDLED_LOG_INTERVAL * 2):
+                self.controller.signal_handler(member='UnknownSignal')
+        finally:
+            controller.log = real_log
+
+        # The first one, the 100th and the 200th
+        self.assertEqual(3, len(fake_log.warnings))
+
+
+if __name__ == '__main__':
+    unittest.main()
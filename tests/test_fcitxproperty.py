@@ -0,0 +1,19 @@
+import unittest
+
+from gimpanel.fcitxproperty import FcitxProperty, parse_property
+
+
+class TestFcitxPropertyFunctions(unittest.TestCase):
+    def test_parse_property(self):
+        prop = parse_property('/Fcitx/im:Pinyin:fcitx-pinyin:Pinyin')
+        self.assertEqual(FcitxProperty('/Fcitx/im', 'Pinyin', 'fcitx-pinyin', 'Pinyin'), prop)
+        self.assertTrue(prop is parse_property('/Fcitx/im:Pinyin:fcitx-pinyin:Pinyin'))
+
+        self.assertEqual(None, parse_property(''))
+        self.assertEqual('a:b', parse_property('/Fcitx/remind:R:icon:a:b').tooltip)
+        self.assertEqual(FcitxProperty('fcitx-keyboard-us', 'Keyboard'),
+                         parse_property('fcitx-keyboard-us:Keyboard'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from gimpanel.gdbuscontroller import to_unicode
+
+
+class TestGDBusControllerFunctions(unittest.TestCase):
+    def test_to_unicode(self):
+        self.assertEqual(u'\u4f60\u597d', to_unicode('\xe4\xbd\xa0\xe5\xa5\xbd'))
+        self.assertTrue(isinstance(to_unicode('1.'), unicode))
+        self.assertEqual([u'1.', u'2.'], to_unicode(['1.', '2.']))
+        self.assertEqual(3, to_unicode(3))
+        self.assertEqual(True, to_unicode(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
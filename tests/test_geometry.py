@@ -0,0 +1,23 @@
+import unittest
+
+from gimpanel.geometry import place_at_cursor, clamp_to_workarea
+
+
+class TestGeometryFunctions(unittest.TestCase):
+    # The second of two 1920x1080 monitors side by side
+    workarea = (1920, 0, 1920, 1080)
+
+    def test_place_at_cursor(self):
+        self.assertEqual((2000, 120), place_at_cursor(2000, 100, 20, 300, 50, self.workarea))
+        # No room on the right of the monitor
+        self.assertEqual((3540, 120), place_at_cursor(3700, 100, 20, 300, 50, self.workarea))
+        # No room below the cursor
+        self.assertEqual((2000, 1000), place_at_cursor(2000, 1050, 20, 300, 50, self.workarea))
+
+    def test_clamp_to_workarea(self):
+        self.assertEqual((2000, 100), clamp_to_workarea(2000, 100, 300, 50, self.workarea))
+        self.assertEqual((1920, 1030), clamp_to_workarea(1800, 1200, 300, 50, self.workarea))
+
+
+if __name__ == '__main__':
+    unittest.main()
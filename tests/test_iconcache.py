@@ -0,0 +1,17 @@
+import unittest
+
+from gimpanel.iconcache import get_im_icon_names
+
+
+class TestIconCacheFunctions(unittest.TestCase):
+    def test_im_icon_names(self):
+        self.assertEqual(['fcitx-kbd', 'fcitx-pinyin', 'fcitx-sunpinyin'],
+                         get_im_icon_names(['fcitx-keyboard-us', 'pinyin',
+                                            'fcitx-keyboard-cn', 'sunpinyin']))
+
+    def test_no_im(self):
+        self.assertEqual([], get_im_icon_names([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ from gimpanel.langpanel import LangPanel
 
 class TestLangPanelFunctions(unittest.TestCase):
     def setUp(self):
-        self.langpanel = LangPanel()
+        self.langpanel = LangPanel(None)
 
     def test_langpanel(self):
         self.assertTrue(self.langpanel.is_default_im())
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gimpanel.statestore import WriteBehindStore, atomic_write
+
+
+class TestStateStoreFunctions(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'gimpanel-state')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_behind(self):
+        written = []
+        store = WriteBehindStore(delay=60)
+        store.write(self.path, '10 20', written.append)
+        store.write(self.path, '30 40', written.append)
+        self.assertFalse(os.path.exists(self.path))
+
+        store.flush()
+        self.assertEqual([self.path], written)
+        self.assertEqual(['gimpanel-state'], os.listdir(self.directory))
+        with open(self.path) as f:
+            self.assertEqual('30 40', f.read())
+
+    def test_atomic_write_keeps_mode(self):
+        with open(self.path, 'w') as f:
+            f.write('10 20')
+        os.chmod(self.path, 0644)
+        link = os.path.join(self.directory, 'link')
+        os.symlink(self.path, link)
+
+        atomic_write(link, '30 40')
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(0644, os.stat(self.path).st_mode & 0777)
+        with open(self.path) as f:
+            self.assertEqual('30 40', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
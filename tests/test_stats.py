@@ -0,0 +1,31 @@
+import unittest
+
+from gimpanel.stats import LatencyHistogram, LatencyStats
+
+
+class TestStatsFunctions(unittest.TestCase):
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        self.assertEqual((0, 0, 0, 0, 0), histogram.summary())
+
+        for value in range(1, 101):
+            histogram.add(value * 100)
+
+        count, p50, p95, p99, max_value = histogram.summary()
+        self.assertEqual(100, count)
+        self.assertEqual(10000, max_value)
+        self.assertTrue(5000 <= p50 < 5000 * LatencyHistogram.BUCKET_GROWTH)
+        self.assertTrue(9500 <= p95 <= p99 <= max_value)
+
+    def test_stats(self):
+        stats = LatencyStats()
+        stats.record('UpdateAux', 'handle', 20)
+        stats.record('UpdateAux', 'paint', 3000)
+        self.assertEqual(['UpdateAux:handle', 'UpdateAux:paint'],
+                         sorted(stats.summary().keys()))
+        stats.reset()
+        self.assertEqual({}, stats.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,15 @@
+import unittest
+
+from gimpanel.textattr import parse_attrs, ATTR_DECORATE, ATTR_FOREGROUND
+
+
+class TestTextAttrFunctions(unittest.TestCase):
+    def test_parse_attrs(self):
+        self.assertEqual([], parse_attrs(''))
+        self.assertEqual([(ATTR_DECORATE, 0, 2, 1), (ATTR_FOREGROUND, 2, 1, 0xff0000)],
+                         parse_attrs('1:0:2:1;2:2:1:16711680'))
+        self.assertEqual([(ATTR_DECORATE, 1, 1, 2)], parse_attrs('1:0:2;x:0:1:1;1:1:1:2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+from gimpanel.trace import TraceRecorder, read_trace
+
+
+class TestTraceFunctions(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_trace(self):
+        recorder = TraceRecorder(self.path)
+        recorder.record('UpdateAux', (u'pin', ''))
+        recorder.record('SetSpotRect', (10, 20, 0, 16))
+        recorder.close()
+
+        events = list(read_trace(self.path))
+        self.assertEqual(['UpdateAux', 'SetSpotRect'], [e[1] for e in events])
+        self.assertEqual([u'pin', u''], events[0][2])
+        self.assertEqual([10, 20, 0, 16], events[1][2])
+        self.assertTrue(events[0][0] <= events[1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from gimpanel.visibility import VisibilityController, HIDDEN, SHOWN, PENDING_HIDE
+
+
+class FakeWindow(object):
+    def __init__(self):
+        self.visible = False
+
+    def get_visible(self):
+        return self.visible
+
+    def show(self):
+        self.visible = True
+
+    def hide(self):
+        self.visible = False
+
+
+class TestVisibilityFunctions(unittest.TestCase):
+    def test_show_hide(self):
+        window = FakeWindow()
+        visibility = VisibilityController(window, 'Fake')
+
+        visibility.set_visible(True)
+        self.assertEqual(SHOWN, visibility.state)
+        self.assertTrue(window.visible)
+
+        visibility.set_visible(False)
+        self.assertEqual(HIDDEN, visibility.state)
+        self.assertFalse(window.visible)
+
+    def test_shown_directly(self):
+        window = FakeWindow()
+        visibility = VisibilityController(window, 'Fake')
+
+        # Like show_all() after the controller was created
+        window.show()
+        visibility.set_visible(False)
+        self.assertEqual(HIDDEN, visibility.state)
+        self.assertFalse(window.visible)
+
+    def test_hide_delay(self):
+        window = FakeWindow()
+        window.show()
+        visibility = VisibilityController(window, 'Fake', hide_delay=100)
+
+        visibility.set_visible(False)
+        self.assertEqual(PENDING_HIDE, visibility.state)
+        self.assertTrue(window.visible)
+
+        # A show while the hide is pending cancels it
+        visibility.set_visible(True)
+        self.assertEqual(SHOWN, visibility.state)
+        self.assertTrue(window.visible)
+
+    def test_flush(self):
+        window = FakeWindow()
+        window.show()
+        visibility = VisibilityController(window, 'Fake', hide_delay=100)
+
+        visibility.set_visible(False)
+        visibility.flush()
+        self.assertEqual(HIDDEN, visibility.state)
+        self.assertFalse(window.visible)
+
+        # Nothing is pending any more
+        visibility.flush()
+        self.assertEqual(HIDDEN, visibility.state)
+
+
+if __name__ == '__main__':
+    unittest.main()